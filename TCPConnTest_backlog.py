@@ -0,0 +1,119 @@
+"""接受队列观测：判断丢弃的 SYN 是因为接受队列溢出，还是应用本身处理不过来
+
+- /proc/net/netstat 中 TcpExt 的 ListenOverflows（完成握手时接受队列已满的次数）和
+  ListenDrops（监听套接字丢弃的连接总数，包含溢出），是全系统计数；
+- 监听套接字当前等待 accept 的连接数及队列上限（SocketCensus.accept_queue）。
+
+接受队列长期接近上限说明事件循环 accept 得不够快，应增大 --backlog、--accept-batch
+或 --workers；队列不满而客户端仍然握手失败，则要看 SYN 队列（tcp_max_syn_backlog、
+syncookies）或网络本身。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set
+
+DEFAULT_BACKLOG = 2048  # 未指定 --backlog 时的上限，实际取 min(最大连接数, 2048)
+ACCEPT_QUEUE_INTERVAL = 1.0  # 检查接受队列的间隔（秒）
+SATURATION_RATIO = 0.9  # 队列占用达到上限的这个比例即视为饱和
+SATURATION_WARN_INTERVAL = 10.0  # 饱和警告的最小间隔（秒）
+LISTEN_COUNTERS = ('ListenOverflows', 'ListenDrops')
+SOMAXCONN_PATH = '/proc/sys/net/core/somaxconn'
+
+
+def read_listen_counters() -> Optional[Dict[str, int]]:
+    """读取 /proc/net/netstat 中的 ListenOverflows 和 ListenDrops，非 Linux 时返回 None"""
+    try:
+        with open('/proc/net/netstat', 'r') as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    # 文件中每个分组占两行：第一行是字段名，第二行是对应的值
+    for names, values in zip(lines[::2], lines[1::2]):
+        if names.startswith('TcpExt:'):
+            counters = dict(zip(names.split()[1:], values.split()[1:]))
+            return {name: int(counters.get(name, 0)) for name in LISTEN_COUNTERS}
+    return None
+
+
+def read_somaxconn() -> Optional[int]:
+    """内核对 listen() backlog 的上限 net.core.somaxconn，无法读取时返回 None"""
+    try:
+        with open(SOMAXCONN_PATH, 'r') as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def counter_delta(current: Optional[Dict[str, int]],
+                  earlier: Optional[Dict[str, int]]) -> Dict[str, int]:
+    if current is None or earlier is None:
+        return {name: 0 for name in LISTEN_COUNTERS}
+    return {name: current[name] - earlier[name] for name in LISTEN_COUNTERS}
+
+
+def format_accept_queue(queue: Optional[Dict[str, float]], counters: Optional[Dict[str, int]],
+                        last: Optional[Dict[str, int]], baseline: Optional[Dict[str, int]]) -> str:
+    """格式化接受队列状态及本周期/启动以来的 ListenOverflows、ListenDrops 增量"""
+    if queue is None:
+        text = "未知"
+    else:
+        limit = f"{queue['limit']:.0f}" if queue['limit'] else "未知"
+        text = f"当前 {queue['depth']:.0f}/{limit}（{queue['listeners']:.0f} 个监听套接字）"
+    if counters is not None:
+        interval = counter_delta(counters, last)
+        total = counter_delta(counters, baseline)
+        text += (f", ListenOverflows +{interval['ListenOverflows']}/累计 {total['ListenOverflows']}"
+                 f", ListenDrops +{interval['ListenDrops']}/累计 {total['ListenDrops']}（全系统，本周期/启动以来）")
+    return text
+
+
+class AcceptQueueMonitor:
+    """定期检查本进程监听套接字的接受队列，饱和时输出警告
+
+    只按本进程监听套接字的队列占用判断：达到 SATURATION_RATIO 时警告，两次警告至少间隔
+    SATURATION_WARN_INTERVAL 秒，期间最满的队列状态累计到下一次警告中。ListenOverflows、
+    ListenDrops 是全系统计数，可能来自本机其他监听套接字，只作为警告的参考信息；多进程时
+    只由 check_counters 为 True 的一个进程读取。
+    """
+
+    def __init__(self, census, inodes: Optional[Set[int]], check_counters: bool = True):
+        self.census = census
+        self.inodes = inodes
+        self.check_counters = check_counters
+
+    async def run(self, interval: float = ACCEPT_QUEUE_INTERVAL) -> None:
+        last = read_listen_counters() if self.check_counters else None
+        last_warning = float('-inf')
+        pending = counter_delta(None, None)  # 上次警告以来的溢出/丢弃次数
+        peak = None  # 上次警告以来最满的一次队列状态
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                queue = await self.census.accept_queue_async(self.inodes)
+                counters = read_listen_counters() if self.check_counters else None
+            except Exception as e:
+                logging.error(f"检查接受队列时出错: {e}")
+                continue
+            for name, value in counter_delta(counters, last).items():
+                pending[name] += value
+            last = counters
+            if queue is not None and (peak is None or queue['fullest'] > peak['fullest']):
+                peak = queue
+            saturated = peak is not None and peak['fullest'] >= SATURATION_RATIO
+            now = time.monotonic()
+            if not saturated:
+                # 队列未饱和，重新开始累计
+                pending = counter_delta(None, None)
+                peak = None
+            elif now - last_warning >= SATURATION_WARN_INTERVAL:
+                state = f"最满时 {peak['depth']:.0f}/{peak['limit']:.0f}（{peak['fullest']:.0%}）"
+                counters_text = (f"（同期全系统 ListenOverflows +{pending['ListenOverflows']}, "
+                                 f"ListenDrops +{pending['ListenDrops']}，可能包含其他监听套接字）"
+                                 if self.check_counters else "")
+                logging.warning(f"接受队列饱和: {state}{counters_text}；事件循环来不及 accept，"
+                                f"可增大 --backlog、--accept-batch 或 --workers")
+                last_warning = now
+                pending = counter_delta(None, None)
+                peak = None
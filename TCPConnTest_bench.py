@@ -0,0 +1,371 @@
+"""本机回环基准测试：在同一台机器上启动服务端和客户端子进程，记录结果并与基线对比
+
+示例：
+    python TCPConnTest_bench.py run --output baseline.json
+    python TCPConnTest_bench.py run --output current.json
+    python TCPConnTest_bench.py compare baseline.json current.json
+    python TCPConnTest_bench.py loops --connections 10000 --rate 5000 --duration 10
+
+run 依次运行固定场景：ramp（按目标速率建立到 N 个连接并保持）、churn（客户端
+--churn 模式，连接建立后立即关闭并持续重复）、throughput（少量连接持续收发回显数据），
+结果保存为 JSON。compare 比较两份结果，任何指标变差超过阈值时以非零状态退出，
+可以用于升级依赖或修改代码前后的把关。loops 用 ramp 场景对比各个事件循环后端。
+仅支持 Linux。
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import re
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from TCPConnTest_loop import LOOP_BACKENDS, backend_available
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(HERE, 'TCPConnTest_server.py')
+CLIENT_SCRIPT = os.path.join(HERE, 'TCPConnTest_client.py')
+SERVER_START_TIMEOUT = 10.0
+SERVER_STOP_TIMEOUT = 30.0
+RSS_SAMPLE_INTERVAL = 0.2
+CLIENT_BASELINE_DURATION = 2.0  # 测量客户端基线内存时只保持 1 个连接运行的时长（秒）
+SCENARIOS = ('ramp', 'churn', 'throughput')
+DEFAULT_THRESHOLD = 10.0  # compare 判定为退化的变化百分比
+
+SERVER_STARTED_RE = re.compile(r'服务器启动（\w+ 引擎），监听地址: ')
+TARGET_REACHED_RE = re.compile(r'已达到目标连接数 (\d+)，用时 ([\d.]+)秒')
+ACTIVE_RE = re.compile(r'当前活动连接: (\d+)')
+SUCCESS_RE = re.compile(r'已达到测试时长 [\d.]+秒，成功建立连接 (\d+)')
+CYCLES_RE = re.compile(r'完成周期 (\d+)（平均 ([\d.]+)/s）')
+THROUGHPUT_RE = re.compile(r'平均吞吐量: 发送 ([\d.]+)MB/s, 接收 ([\d.]+)MB/s, 消息 ([\d.]+)/s')
+LOOP_LAG_RE = re.compile(r'事件循环延迟\(累计\): p50=[\d.]+ms p90=[\d.]+ms p99=([\d.]+)ms '
+                         r'p99\.9=[\d.]+ms max=([\d.]+)ms')
+
+# 指标的优劣方向，compare 据此判断变化是改进还是退化
+HIGHER_IS_BETTER = frozenset(('connects_per_sec', 'mean_connects_per_sec', 'cycles_per_sec',
+                              'throughput_mb_s', 'messages_per_sec', 'max_active'))
+LOWER_IS_BETTER = frozenset(('time_to_target', 'server_rss_per_conn_kb', 'client_rss_per_conn_kb',
+                             'client_cpu', 'server_cpu', 'loop_lag_p99_ms', 'loop_lag_max_ms'))
+# 波动较大的指标使用更宽的阈值（百分比），None 表示只显示不判定
+NOISY_THRESHOLDS = {'loop_lag_p99_ms': 50.0, 'loop_lag_max_ms': None}
+
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _process_rss(pid: int) -> int:
+    """读取子进程的常驻内存（字节），进程已退出时返回 0"""
+    try:
+        with open(f'/proc/{pid}/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+def _python_command(script: str, options: Dict[str, object]) -> List[str]:
+    command = [sys.executable, script]
+    for name, value in options.items():
+        if value is True:
+            command.append(f'--{name}')  # 开关参数
+        else:
+            command += [f'--{name}', str(value)]
+    return command
+
+
+def start_server(port: int, options: Dict[str, object], log_path: str) -> subprocess.Popen:
+    """启动服务端子进程并等待其开始监听"""
+    command = _python_command(SERVER_SCRIPT, dict(host='127.0.0.1', port=port, **options))
+    log = open(log_path, 'w')
+    process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        # 先确认进程仍在运行，端口被占用等启动失败时日志中是“服务器启动失败”
+        if process.poll() is not None:
+            break
+        with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+            if SERVER_STARTED_RE.search(f.read()):
+                return process
+        time.sleep(0.1)
+    stop_process(process)
+    raise RuntimeError(f"服务端未能启动，日志见 {log_path}")
+
+
+def stop_process(process: subprocess.Popen, timeout: float = SERVER_STOP_TIMEOUT) -> None:
+    """发送 SIGINT 并等待退出，超时后强制结束"""
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def run_client(port: int, options: Dict[str, object], log_path: str,
+               server: subprocess.Popen) -> Dict:
+    """运行客户端子进程直到 --duration 结束，期间采样两端的内存峰值"""
+    command = _python_command(CLIENT_SCRIPT, dict(server_ip='127.0.0.1', server_port=port,
+                                                  error_log=log_path + '.err', **options))
+    deadline = time.monotonic() + float(options.get('duration', 0)) + 60
+    peak_server = peak_client = 0
+    with open(log_path, 'w') as log:
+        client = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+        while client.poll() is None:
+            if time.monotonic() > deadline:
+                client.kill()
+                client.wait()
+                raise RuntimeError(f"客户端运行超时，日志见 {log_path}")
+            peak_server = max(peak_server, _process_rss(server.pid))
+            peak_client = max(peak_client, _process_rss(client.pid))
+            time.sleep(RSS_SAMPLE_INTERVAL)
+    with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+        output = f.read()
+    return dict(output=output, peak_server_rss=peak_server, peak_client_rss=peak_client)
+
+
+def parse_client_log(output: str, duration: float) -> Dict[str, Optional[float]]:
+    """从客户端报告和结束汇总中提取指标"""
+    metrics: Dict[str, Optional[float]] = {}
+    success = SUCCESS_RE.search(output)
+    connections = int(success.group(1)) if success else 0
+    metrics['connections'] = connections
+    metrics['max_active'] = max((int(n) for n in ACTIVE_RE.findall(output)), default=0)
+    reached = TARGET_REACHED_RE.search(output)
+    metrics['time_to_target'] = float(reached.group(2)) if reached else None
+    # 两种速率含义不同，分开记录：达到目标前的建立速率，以及整个测试时长内的平均速率
+    if reached and float(reached.group(2)) > 0:
+        metrics['connects_per_sec'] = round(int(reached.group(1)) / float(reached.group(2)), 1)
+    else:
+        metrics['connects_per_sec'] = None
+    metrics['mean_connects_per_sec'] = round(connections / duration, 1) if duration else 0.0
+    cycles = CYCLES_RE.search(output)
+    if cycles:
+        metrics['cycles'] = int(cycles.group(1))
+        metrics['cycles_per_sec'] = float(cycles.group(2))
+    throughput = THROUGHPUT_RE.search(output)
+    if throughput:
+        metrics['throughput_mb_s'] = float(throughput.group(2))
+        metrics['messages_per_sec'] = float(throughput.group(3))
+    lag = LOOP_LAG_RE.search(output)
+    if lag:
+        metrics['loop_lag_p99_ms'] = float(lag.group(1))
+        metrics['loop_lag_max_ms'] = float(lag.group(2))
+    return metrics
+
+
+def measure(name: str, server_options: Dict[str, object], client_options: Dict[str, object],
+            args: argparse.Namespace, workdir: str) -> Dict[str, Optional[float]]:
+    """启动一对服务端/客户端运行一个场景，返回指标字典"""
+    # 两端都以 SO_LINGER=0 关闭连接，不留 TIME_WAIT，下一个场景不受上一个场景影响
+    server = start_server(args.port, dict(server_options, loop=args.loop, engine=args.server_engine,
+                                          **{'shutdown-mode': 'abort'}),
+                          os.path.join(workdir, f'server-{name}.log'))
+    try:
+        baseline_rss = _process_rss(server.pid)
+        # 客户端基线：同样的参数只保持 1 个连接，扣除解释器、模块和事件循环本身的内存
+        client_baseline = run_client(args.port, dict(client_options, loop=args.loop, engine=args.engine,
+                                                     duration=CLIENT_BASELINE_DURATION,
+                                                     **{'max-connections': 1, 'shutdown-mode': 'abort'}),
+                                     os.path.join(workdir, f'client-{name}-baseline.log'), server)
+        cpu_before = _children_cpu()
+        result = run_client(args.port, dict(client_options, loop=args.loop, engine=args.engine,
+                                            duration=args.duration, **{'shutdown-mode': 'abort'}),
+                            os.path.join(workdir, f'client-{name}.log'), server)
+        client_cpu = _children_cpu() - cpu_before
+    finally:
+        cpu_before = _children_cpu()
+        stop_process(server)
+        server_cpu = _children_cpu() - cpu_before
+    metrics = parse_client_log(result['output'], args.duration)
+    metrics['client_cpu'] = round(client_cpu, 3)
+    metrics['server_cpu'] = round(server_cpu, 3)
+    held = metrics['max_active']
+    if held:
+        metrics['server_rss_per_conn_kb'] = round((result['peak_server_rss'] - baseline_rss) / held / 1024, 3)
+        metrics['client_rss_per_conn_kb'] = round(
+            (result['peak_client_rss'] - client_baseline['peak_client_rss']) / held / 1024, 3)
+    return metrics
+
+
+def scenario_ramp(args: argparse.Namespace, workdir: str) -> Dict:
+    """按目标速率建立到 N 个连接并保持"""
+    return measure('ramp', {'max-clients': args.connections + 100, 'idle-timeout': 0}, {
+        'rate': args.rate, 'max-connections': args.connections,
+        'file-limit': args.connections + 1000, 'heartbeat-interval': 0}, args, workdir)
+
+
+def scenario_churn(args: argparse.Namespace, workdir: str) -> Dict:
+    """客户端 --churn 模式：按目标速率建立连接后立即关闭，最多 N 个周期同时进行"""
+    return measure('churn', {'max-clients': args.churn_connections + 100, 'idle-timeout': 0}, {
+        'churn': True, 'rate': args.rate, 'max-connections': args.churn_connections,
+        'file-limit': args.churn_connections + 1000}, args, workdir)
+
+
+def scenario_throughput(args: argparse.Namespace, workdir: str) -> Dict:
+    """少量连接以固定消息大小和管线深度持续收发回显数据"""
+    return measure('throughput', {'idle-timeout': 0}, {
+        'rate': 1000, 'max-connections': args.throughput_connections,
+        'message-size': args.message_size, 'pipeline': args.pipeline}, args, workdir)
+
+
+SCENARIO_FUNCS = {'ramp': scenario_ramp, 'churn': scenario_churn, 'throughput': scenario_throughput}
+
+
+def cmd_run(args: argparse.Namespace) -> None:
+    skipped = [name for name in ('churn', 'throughput') if name in args.scenarios]
+    if args.engine == 'epoll' and skipped:
+        logging.warning(f"epoll 引擎不支持周转和吞吐量模式，跳过 {', '.join(skipped)} 场景")
+        args.scenarios = [name for name in args.scenarios if name not in skipped]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='tcpconntest-bench-') as workdir:
+        for name in args.scenarios:
+            logging.info(f"正在运行场景: {name}")
+            results[name] = SCENARIO_FUNCS[name](args, workdir)
+            logging.info(f"{name}: {results[name]}")
+    document = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': {key: value for key, value in vars(args).items() if key != 'func'},
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False, indent=2)
+    logging.info(f"结果已保存到 {args.output}")
+
+
+def compare_results(baseline: Dict, current: Dict, threshold: float) -> List[Dict]:
+    """逐个场景、逐个指标比较，返回变化记录；regression 表示变差超过阈值"""
+    rows = []
+    for scenario, base_metrics in baseline.get('results', {}).items():
+        metrics = current.get('results', {}).get(scenario)
+        if metrics is None:
+            continue
+        for name, base in base_metrics.items():
+            value = metrics.get(name)
+            if name not in HIGHER_IS_BETTER and name not in LOWER_IS_BETTER:
+                continue
+            if base is None or value is None or base == 0:
+                # 基线达到了目标而本次没有，同样算退化
+                regression = name == 'time_to_target' and base is not None and value is None
+                rows.append(dict(scenario=scenario, metric=name, baseline=base, current=value,
+                                 change=None, regression=regression))
+                continue
+            change = (value - base) / abs(base) * 100
+            worse = -change if name in HIGHER_IS_BETTER else change
+            limit = NOISY_THRESHOLDS[name] if name in NOISY_THRESHOLDS else threshold
+            if limit is not None:
+                limit = max(limit, threshold)
+            rows.append(dict(scenario=scenario, metric=name, baseline=base, current=value,
+                             change=change, regression=limit is not None and worse > limit))
+    return rows
+
+
+def _format_value(value) -> str:
+    return '-' if value is None else f"{value:.6g}"
+
+
+def cmd_compare(args: argparse.Namespace) -> None:
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+    rows = compare_results(baseline, current, args.threshold)
+    lines = []
+    for row in rows:
+        change = f"{row['change']:+.1f}%" if row['change'] is not None else '-'
+        mark = '  <-- 退化' if row['regression'] else ''
+        lines.append(f"{row['scenario']:<12}{row['metric']:<26}{_format_value(row['baseline']):>14}"
+                     f"{_format_value(row['current']):>14}{change:>10}{mark}")
+    table = '\n'.join(lines)
+    logging.info(f"基线对比（阈值 {args.threshold:g}%）:\n{table}")
+    regressions = [row for row in rows if row['regression']]
+    if regressions:
+        logging.warning(f"发现 {len(regressions)} 项退化")
+        sys.exit(1)
+    logging.info("未发现退化")
+
+
+def cmd_loops(args: argparse.Namespace) -> None:
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='tcpconntest-bench-') as workdir:
+        for loop in args.loops.split(','):
+            if not backend_available(loop):
+                logging.warning(f"事件循环后端 {loop} 不可用，跳过")
+                continue
+            logging.info(f"正在测试事件循环后端: {loop}")
+            args.loop = loop
+            results[loop] = scenario_ramp(args, workdir)
+            logging.info(f"{loop}: {results[loop]}")
+    if results:
+        keys = ('connections', 'max_active', 'connects_per_sec', 'time_to_target',
+                'client_cpu', 'server_cpu')
+        lines = [f"{'loop':<10}" + ''.join(f"{key:>18}" for key in keys)]
+        for loop, metrics in results.items():
+            lines.append(f"{loop:<10}" + ''.join(f"{_format_value(metrics.get(key)):>18}" for key in keys))
+        logging.info("基准测试结果:\n" + '\n'.join(lines))
+
+
+def _add_scenario_options(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--connections', type=int, default=10000, help='ramp 场景的目标连接数（默认为10000）')
+    parser.add_argument('--rate', type=float, default=5000, help='目标连接速率（连接/秒，默认为5000）')
+    parser.add_argument('--duration', type=float, default=10, help='每个场景的测试时长（秒，默认为10）')
+    parser.add_argument('--engine', default='asyncio', help='客户端连接引擎（默认为asyncio）')
+    parser.add_argument('--server-engine', default='protocol', help='服务端连接处理引擎（默认为protocol）')
+    parser.add_argument('--port', type=int, default=19900, help='回环测试使用的端口（默认为19900）')
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="TCPConnTest 本机回环基准测试")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help='运行固定场景并保存 JSON 结果')
+    _add_scenario_options(run)
+    run.add_argument('--scenarios', type=lambda value: value.split(','), default=list(SCENARIOS),
+                     help=f"要运行的场景，逗号分隔（默认为{','.join(SCENARIOS)}）")
+    run.add_argument('--churn-connections', type=int, default=2000, help='churn 场景同时进行的周期数上限（默认为2000）')
+    run.add_argument('--throughput-connections', type=int, default=20,
+                     help='throughput 场景的连接数（默认为20）')
+    run.add_argument('--message-size', type=int, default=16384, help='throughput 场景的消息大小（默认为16384）')
+    run.add_argument('--pipeline', type=int, default=4, help='throughput 场景每连接在途消息数（默认为4）')
+    run.add_argument('--loop', choices=LOOP_BACKENDS, default='asyncio', help='事件循环后端（默认为asyncio）')
+    run.add_argument('--output', default='bench-results.json', help='结果文件（默认为bench-results.json）')
+    run.set_defaults(func=cmd_run)
+
+    compare = subparsers.add_parser('compare', help='与基线结果比较，发现退化时以状态码 1 退出')
+    compare.add_argument('baseline', help='基线结果文件')
+    compare.add_argument('current', help='本次结果文件')
+    compare.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                         help=f'判定为退化的变化百分比（默认为{DEFAULT_THRESHOLD:g}）')
+    compare.set_defaults(func=cmd_compare)
+
+    loops = subparsers.add_parser('loops', help='用 ramp 场景对比各个事件循环后端')
+    _add_scenario_options(loops)
+    loops.add_argument('--loops', default=','.join(LOOP_BACKENDS),
+                       help=f"要测试的事件循环后端，逗号分隔（默认为{','.join(LOOP_BACKENDS)}）")
+    loops.set_defaults(func=cmd_loops)
+
+    args = parser.parse_args()
+    unknown = [name for name in getattr(args, 'scenarios', []) if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {','.join(unknown)}")
+    return args
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    args = parse_args()
+    args.func(args)
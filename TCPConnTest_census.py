@@ -0,0 +1,315 @@
+"""进程内TCP连接状态统计：按端口过滤，按状态计数，不依赖 ss/netstat 输出整张连接表
+
+Linux 下优先通过 netlink sock_diag 查询（过滤在内核中完成），失败时逐行解析
+/proc/net/tcp{,6}；其他系统退回到 netstat。阻塞查询通过 count_async 放到线程池中
+执行，避免阻塞事件循环；没有事件循环的同步报告循环（epoll 引擎、多进程汇总）使用
+count_nowait，在后台线程中统计。
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import struct
+import subprocess
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+# 内核 include/net/tcp_states.h 中的状态编号
+TCP_STATES = {
+    1: 'ESTABLISHED',
+    2: 'SYN_SENT',
+    3: 'SYN_RECV',
+    4: 'FIN_WAIT1',
+    5: 'FIN_WAIT2',
+    6: 'TIME_WAIT',
+    7: 'CLOSE',
+    8: 'CLOSE_WAIT',
+    9: 'LAST_ACK',
+    10: 'LISTEN',
+    11: 'CLOSING',
+    12: 'NEW_SYN_RECV',
+}
+
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+INET_DIAG_REQ_BYTECODE = 1
+INET_DIAG_BC_S_GE = 2
+INET_DIAG_BC_S_LE = 3
+INET_DIAG_BC_D_GE = 4
+INET_DIAG_BC_D_LE = 5
+
+_NLMSGHDR = struct.Struct('=IHHII')
+_BC_OP = struct.Struct('=BBH')
+_DIAG_QUEUES = struct.Struct('=II')  # inet_diag_msg 中的 idiag_rqueue、idiag_wqueue
+_DIAG_QUEUES_OFFSET = 56
+_DIAG_INODE = struct.Struct('=I')
+_DIAG_INODE_OFFSET = 68
+TCP_LISTEN = 10
+
+
+def _port_bytecode(port: int, local: bool) -> bytes:
+    """生成只匹配指定本地/远端端口的 inet_diag 过滤字节码（port >= P 且 port <= P）"""
+    ge, le = (INET_DIAG_BC_S_GE, INET_DIAG_BC_S_LE) if local else (INET_DIAG_BC_D_GE, INET_DIAG_BC_D_LE)
+    # 每个比较占两个 op（第二个 op 的 no 字段存端口），共 16 字节；
+    # 跳转到 len + 4 表示拒绝，恰好跳到末尾表示接受
+    return (_BC_OP.pack(ge, 8, 20) + _BC_OP.pack(0, 0, port) +
+            _BC_OP.pack(le, 8, 12) + _BC_OP.pack(0, 0, port))
+
+
+def _sock_diag_dump(port: int, local: bool, family: int, states: int = 0xFFFFFFFF):
+    """通过 netlink sock_diag 查询一个地址族中匹配端口的连接，逐个产出 inet_diag_msg"""
+    bytecode = _port_bytecode(port, local)
+    # inet_diag_req_v2: family, protocol, ext, pad, states, 48 字节的 inet_diag_sockid
+    req = struct.pack('=BBBBI', family, socket.IPPROTO_TCP, 0, 0, states) + bytes(48)
+    attr = struct.pack('=HH', 4 + len(bytecode), INET_DIAG_REQ_BYTECODE) + bytecode
+    payload = req + attr
+    message = _NLMSGHDR.pack(_NLMSGHDR.size + len(payload), SOCK_DIAG_BY_FAMILY,
+                             NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + payload
+
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_SOCK_DIAG) as sock:
+        sock.sendall(message)
+        while True:
+            data = sock.recv(1 << 16)
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, msg_type = _NLMSGHDR.unpack_from(data, offset)[:2]
+                if msg_type == NLMSG_DONE:
+                    return
+                if msg_type == NLMSG_ERROR:
+                    errno_value = -struct.unpack_from('=i', data, offset + _NLMSGHDR.size)[0]
+                    raise OSError(errno_value, os.strerror(errno_value))
+                yield data[offset + _NLMSGHDR.size:offset + length]
+                offset += (length + 3) & ~3
+            if not data:
+                return
+
+
+def _sock_diag_count(port: int, local: bool, family: int, counts: Counter) -> None:
+    """通过 netlink sock_diag 统计一个地址族中匹配端口的连接状态"""
+    for msg in _sock_diag_dump(port, local, family):
+        # inet_diag_msg 的第二个字节是连接状态
+        counts[TCP_STATES.get(msg[1], 'UNKNOWN')] += 1
+
+
+def _proc_net_count(port: int, local: bool, counts: Counter) -> bool:
+    """逐行解析 /proc/net/tcp{,6}，只统计匹配端口的连接；文件都不存在时返回 False"""
+    port_hex = f':{port:04X}'
+    column = 1 if local else 2
+    found = False
+    for path in ('/proc/net/tcp', '/proc/net/tcp6'):
+        try:
+            with open(path, 'r') as f:
+                found = True
+                next(f, None)  # 跳过标题行
+                for line in f:
+                    fields = line.split(None, 4)
+                    if fields[column].endswith(port_hex):
+                        counts[TCP_STATES.get(int(fields[3], 16), 'UNKNOWN')] += 1
+        except FileNotFoundError:
+            continue
+    return found
+
+
+def _listen_queues(port: int) -> List[Tuple[int, int, int]]:
+    """返回本地端口为 port 的各个监听套接字的 (inode, 接受队列长度, 队列上限)
+
+    LISTEN 状态下 inet_diag_msg 的 rqueue 是已完成握手、等待 accept 的连接数，
+    wqueue 是 listen() 的 backlog（已被 somaxconn 限制）。sock_diag 不可用时退回到
+    /proc/net/tcp{,6}，其中只有队列长度，上限记为 0。
+    """
+    queues = []
+    try:
+        for family in (socket.AF_INET, socket.AF_INET6):
+            for msg in _sock_diag_dump(port, True, family, 1 << TCP_LISTEN):
+                depth, limit = _DIAG_QUEUES.unpack_from(msg, _DIAG_QUEUES_OFFSET)
+                queues.append((_DIAG_INODE.unpack_from(msg, _DIAG_INODE_OFFSET)[0], depth, limit))
+        return queues
+    except OSError:
+        queues.clear()
+    port_hex = f':{port:04X}'
+    for path in ('/proc/net/tcp', '/proc/net/tcp6'):
+        try:
+            with open(path, 'r') as f:
+                next(f, None)
+                for line in f:
+                    fields = line.split()
+                    if fields[1].endswith(port_hex) and int(fields[3], 16) == TCP_LISTEN:
+                        queues.append((int(fields[9]), int(fields[4].split(':')[1], 16), 0))
+        except FileNotFoundError:
+            continue
+    return queues
+
+
+def _netstat_count(port: int, local: bool, counts: Counter) -> None:
+    """非 Linux 系统的后备方案：解析 netstat 输出"""
+    result = subprocess.run(['netstat', '-an'], capture_output=True, text=True)
+    column = 1 if local else 2
+    for line in result.stdout.splitlines():
+        fields = line.split()
+        if len(fields) < 4 or not fields[0].upper().startswith('TCP'):
+            continue
+        # Linux/macOS 的 netstat 多一列收发队列
+        if fields[0].lower().startswith('tcp') and len(fields) >= 6:
+            fields = [fields[0]] + fields[3:]
+        address = fields[column]
+        if address.rsplit(':', 1)[-1] == str(port) or address.rsplit('.', 1)[-1] == str(port):
+            counts[fields[-1].upper()] += 1
+
+
+class SocketCensus:
+    """按端口统计本机TCP连接状态
+
+    local=True 统计本地端口为 port 的连接（服务端），否则统计远端端口为 port 的连接（客户端）。
+    """
+
+    def __init__(self, port: int, local: bool = True):
+        self.port = port
+        self.local = local
+        self.method: Optional[str] = None  # 最近一次成功使用的统计方式
+        self._executor: Optional[ThreadPoolExecutor] = None  # count_nowait 的后台线程
+        self._pending: Optional[Future] = None
+        self._latest: Optional[Dict[str, int]] = None
+
+    def count(self) -> Optional[Dict[str, int]]:
+        """阻塞地统计各状态连接数，无法统计时返回 None"""
+        counts: Counter = Counter()
+        if hasattr(socket, 'AF_NETLINK'):
+            try:
+                for family in (socket.AF_INET, socket.AF_INET6):
+                    _sock_diag_count(self.port, self.local, family, counts)
+                self.method = 'sock_diag'
+                return dict(counts)
+            except OSError as e:
+                if self.method != 'proc':
+                    logging.debug(f"sock_diag 查询失败，改用 /proc/net/tcp: {e}")
+                counts.clear()
+        try:
+            if hasattr(socket, 'AF_NETLINK') and _proc_net_count(self.port, self.local, counts):
+                self.method = 'proc'
+                return dict(counts)
+            _netstat_count(self.port, self.local, counts)
+            self.method = 'netstat'
+            return dict(counts)
+        except FileNotFoundError:
+            logging.warning("无法获取系统连接统计信息")
+        except OSError as e:
+            # 文件描述符耗尽等情况下统计失败，不影响报告的其他部分
+            logging.debug(f"统计系统连接状态失败: {e}")
+        return None
+
+    async def count_async(self) -> Optional[Dict[str, int]]:
+        """在线程池中执行统计，不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.count)
+
+    def count_nowait(self) -> Optional[Dict[str, int]]:
+        """立即返回上一次在后台线程中完成的统计，并在空闲时开始下一次
+
+        连接数很多时一次统计要遍历全部连接，同步的报告循环不能等待它完成；结果因此
+        比调用晚一个报告周期，第一次调用时返回 None。
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='census')
+        if self._pending is not None and self._pending.done():
+            try:
+                self._latest = self._pending.result()
+            except Exception as e:
+                logging.debug(f"统计系统连接状态失败: {e}")
+                self._latest = None
+            self._pending = None
+        if self._pending is None:
+            self._pending = self._executor.submit(self.count)
+        return self._latest
+
+    def accept_queue(self, inodes: Optional[Set[int]] = None) -> Optional[Dict[str, float]]:
+        """统计端口上监听套接字的接受队列，inodes 非空时只统计这些套接字（本进程的监听套接字）
+
+        返回 listeners（监听套接字数）、depth（等待 accept 的连接总数）、limit（队列上限之和，
+        未知时为 0）和 fullest（最满的一个队列的占用比例）；非 Linux 或查询失败时返回 None。
+        """
+        if not self.local or not hasattr(socket, 'AF_NETLINK'):
+            return None
+        try:
+            queues = [q for q in _listen_queues(self.port) if not inodes or q[0] in inodes]
+        except OSError as e:
+            logging.debug(f"查询监听套接字队列失败: {e}")
+            return None
+        return {
+            'listeners': len(queues),
+            'depth': sum(depth for _, depth, _ in queues),
+            'limit': sum(limit for _, _, limit in queues),
+            'fullest': max((depth / limit for _, depth, limit in queues if limit), default=0.0),
+        }
+
+    async def accept_queue_async(self, inodes: Optional[Set[int]] = None) -> Optional[Dict[str, float]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.accept_queue, inodes)
+
+
+def format_census(counts: Optional[Dict[str, int]]) -> str:
+    """将统计结果格式化为报告中的两行：ESTABLISHED 数量及其他状态分布"""
+    if counts is None:
+        return "系统ESTABLISHED连接: 未知"
+    others = ', '.join(f"{state}={n}" for state, n in sorted(counts.items())
+                       if state != 'ESTABLISHED')
+    return (f"系统ESTABLISHED连接: {counts.get('ESTABLISHED', 0)}\n"
+            f"其他TCP状态: {others or '无'}")
+
+
+# /proc/slabinfo 中每个 TCP 套接字、握手中的请求和 TIME_WAIT 占用的 slab
+TCP_SLABS = frozenset(('TCP', 'TCPv6', 'request_sock_TCP', 'request_sock_TCPv6',
+                       'tw_sock_TCP', 'tw_sock_TCPv6'))
+
+
+def read_kernel_memory() -> Optional[Dict[str, int]]:
+    """读取全系统的 TCP 内核内存，非 Linux 时返回 None
+
+    sockets 和 buffer_bytes 来自 /proc/net/sockstat（TCP inuse 和以页为单位的 mem），
+    slab_bytes 来自 /proc/slabinfo（TCP 相关 slab 的 active_objs × objsize）；
+    slabinfo 通常只有 root 可读，不可读时结果中没有 slab_bytes。
+    """
+    memory: Dict[str, int] = {}
+    try:
+        with open('/proc/net/sockstat', 'r') as f:
+            for line in f:
+                if line.startswith('TCP:'):
+                    fields = line.split()[1:]
+                    values = dict(zip(fields[::2], fields[1::2]))
+                    memory['sockets'] = int(values.get('inuse', 0))
+                    memory['buffer_bytes'] = int(values.get('mem', 0)) * os.sysconf('SC_PAGE_SIZE')
+                    break
+    except (OSError, ValueError):
+        return None
+    try:
+        slab_bytes = 0
+        with open('/proc/slabinfo', 'r') as f:
+            for line in f:
+                fields = line.split()
+                if fields and fields[0] in TCP_SLABS:
+                    slab_bytes += int(fields[1]) * int(fields[3])
+        memory['slab_bytes'] = slab_bytes
+    except (OSError, ValueError, IndexError):
+        pass
+    return memory
+
+
+def format_kernel_memory(memory: Optional[Dict[str, int]], baseline: Optional[Dict[str, int]],
+                         connections: int) -> str:
+    """格式化全系统 TCP 内核内存及扣除启动基线后的每连接平均值"""
+    if memory is None:
+        return "未知"
+    total = memory.get('buffer_bytes', 0) + memory.get('slab_bytes', 0)
+    slab = memory.get('slab_bytes')
+    text = (f"缓冲区 {memory.get('buffer_bytes', 0) / 1048576:.1f}MB, "
+            f"slab {f'{slab / 1048576:.1f}MB' if slab is not None else '不可读（需要 root）'}, "
+            f"TCP 套接字 {memory.get('sockets', 0)}")
+    if connections > 0 and baseline is not None:
+        base = baseline.get('buffer_bytes', 0) + (baseline.get('slab_bytes', 0) if slab is not None else 0)
+        text += f" (每连接 {(total - base) / connections / 1024:.2f}KB)"
+    return text
@@ -0,0 +1,65 @@
+"""连接周转（churn）模式：每个连接建立后可选收发 N 字节回显数据，然后立即关闭
+
+用于测量持续的建立/关闭周期速率和 TIME_WAIT 压力，而不是保持长连接。每个周期
+按比例选择由哪一端先关闭（先发送 FIN 的一端是主动关闭方，TIME_WAIT 留在这一端）：
+
+- 客户端关闭：客户端 write_eof() 发送 FIN，服务端读到 EOF 后关闭自己一侧
+- 服务端关闭：客户端发送 CLOSE_REQUEST，服务端收到后立即关闭连接
+
+CLOSE_REQUEST 在收到全部回显之后单独发送，服务端一次读取恰好得到这几个字节，
+只需比较长度和内容，不影响普通回显。关闭延迟从发出 FIN 或关闭请求算起，到收到
+对端的 FIN（读到 EOF）为止。
+"""
+
+import asyncio
+import time
+
+CLOSE_REQUEST = b'\x00close\n'  # 要求服务端主动关闭连接
+CHURN_TIMEOUT = 10.0  # 每个阶段等待对端回显或关闭的时限（秒）
+
+
+class ChurnPlan:
+    """每个周期交换的数据和关闭方式；按比例轮流分配关闭方，不使用随机数"""
+
+    __slots__ = ('payload', 'server_close_ratio', '_credit')
+
+    def __init__(self, size: int = 0, server_close_ratio: float = 0.0):
+        self.payload = bytes(size)
+        self.server_close_ratio = server_close_ratio
+        self._credit = 0.0
+
+    def server_closes(self) -> bool:
+        """本周期是否由服务端先关闭；长期来看比例恰好为 server_close_ratio"""
+        self._credit += self.server_close_ratio
+        if self._credit >= 1.0:
+            self._credit -= 1.0
+            return True
+        return False
+
+    def describe(self) -> str:
+        return (f"每周期交换 {len(self.payload)} 字节，"
+                f"服务端先关闭 {self.server_close_ratio:.0%}，客户端先关闭 {1 - self.server_close_ratio:.0%}")
+
+
+async def run_cycle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                    plan: ChurnPlan, stats) -> None:
+    """在已建立的连接上完成一个周期的数据交换和关闭握手；stats 为客户端的 ClientStats"""
+    if plan.payload:
+        writer.write(plan.payload)
+        await writer.drain()
+        await asyncio.wait_for(reader.readexactly(len(plan.payload)), CHURN_TIMEOUT)
+    server_close = plan.server_closes()
+    started = time.perf_counter()
+    if server_close:
+        writer.write(CLOSE_REQUEST)
+    else:
+        writer.write_eof()
+    if await asyncio.wait_for(reader.read(len(CLOSE_REQUEST)), CHURN_TIMEOUT):
+        # 不支持关闭请求的旧版服务端会把它原样回显
+        raise ConnectionError("服务端没有按关闭请求关闭连接")
+    stats.teardown_latency.record(time.perf_counter() - started)
+    stats.cycles += 1
+    if server_close:
+        stats.server_closes += 1
+    else:
+        stats.client_closes += 1
@@ -3,8 +3,33 @@ import argparse
 import time
 import logging
 import sys
-import subprocess
 import os
+import itertools
+import select
+import signal
+import socket
+import multiprocessing
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+
+from TCPConnTest_census import SocketCensus, format_census, format_kernel_memory, read_kernel_memory
+from TCPConnTest_churn import ChurnPlan, run_cycle
+from TCPConnTest_control import CONTROL_PORT, Agent, Controller, parse_address
+from TCPConnTest_framing import MIN_REQUEST_SIZE, RequestFramer
+from TCPConnTest_logging import (DEFAULT_LOG_RATE, EventSampler, restart_queue_logging,
+                                 start_queue_logging, stop_queue_logging)
+from TCPConnTest_loop import LOOP_BACKENDS, LOOP_HELP, install_event_loop, monitor_loop_lag
+from TCPConnTest_metrics import render_metrics, start_metrics_server, start_metrics_thread
+from TCPConnTest_pacer import (RAMP_HELP, ConcurrencyController, RampProfile, TokenBucketPacer,
+                               classify_failure, parse_ramp)
+from TCPConnTest_registry import ConnectionRegistry
+from TCPConnTest_shutdown import (SHUTDOWN_BATCH, SHUTDOWN_MODES, SHUTDOWN_TIMEOUT,
+                                  ShutdownPolicy, install_stop_handler)
+from TCPConnTest_sockopts import SOCKET_PROFILE_HELP, SOCKET_PROFILES, SocketProfile, get_profile
+from TCPConnTest_sources import SourceAddressPool, format_sources, local_port_capacity, parse_source_ips
+from TCPConnTest_stats import LatencyHistogram, format_latency, format_throughput, take_snapshot
+from TCPConnTest_timerwheel import TimerWheel
+from TCPConnTest_workers import publish_stats, run_workers, split_evenly
 
 # 根据操作系统选择性导入 resource 模块
 if os.name != 'nt':  # 如果不是 Windows 系统
@@ -22,14 +47,39 @@ else:
     
     resource = DummyResource()
 
-class MaxLevelFilter(logging.Filter):
-    """只允许指定级别及以下的日志通过"""
-    def __init__(self, max_level):
-        super().__init__()
-        self.max_level = max_level
+HEARTBEAT = b'ping'
+HEARTBEAT_INTERVAL = 60  # 默认心跳间隔（秒）
+MAX_PENDING = 1000  # 默认同时握手的连接数上限
+THROUGHPUT_READ_SIZE = 65536  # 吞吐量模式每次读取的最大字节数
+ENGINES = ('asyncio', 'epoll')
+METRICS_HOST = '0.0.0.0'
+METRICS_PREFIX = 'tcpconntest_client'
+CLIENT_METRICS = (
+    ('success', 'connections_total', 'counter', '成功建立的连接总数'),
+    ('active', 'connections_active', 'gauge', '当前活动连接数'),
+    ('pending', 'connections_pending', 'gauge', '正在握手的连接数'),
+    ('attempts', 'connect_attempts_total', 'counter', '已发起的连接数'),
+    ('failures', 'connect_failures_total', 'counter', '按 errno 分类的连接失败次数', 'errno'),
+    ('backoffs', 'backoffs_total', 'counter', '因本机资源耗尽而退避的次数'),
+    ('target_rate', 'target_rate', 'gauge', '当前目标连接速率（连接/秒）'),
+    ('concurrency_limit', 'concurrency_limit', 'gauge', '当前允许同时握手的连接数'),
+    ('source_active', 'source_connections_active', 'gauge', '每个源地址的活动连接数', 'source'),
+    ('source_failures', 'source_failures_total', 'counter', '每个源地址的失败次数', 'source'),
+    ('bytes_sent', 'bytes_sent_total', 'counter', '吞吐量模式发送的字节数'),
+    ('bytes_received', 'bytes_received_total', 'counter', '吞吐量模式接收的字节数'),
+    ('messages', 'messages_total', 'counter', '吞吐量模式完成的消息数'),
+    ('cycles', 'churn_cycles_total', 'counter', 'churn 模式完成的建立/关闭周期数'),
+    ('connect_latency', 'connect_latency_seconds', 'histogram', '握手耗时'),
+    ('teardown_latency', 'teardown_latency_seconds', 'histogram', 'churn 模式的关闭握手耗时'),
+    ('rtt', 'request_rtt_seconds', 'histogram', '请求/响应模式的往返时间'),
+    ('loop_lag', 'loop_lag_seconds', 'histogram', '事件循环延迟'),
+)
 
+class ConsoleFilter(logging.Filter):
+    """控制台不显示逐连接的错误（带 summary_key，如连接失败），它们只写入错误日志文件，
+    状态报告中已有按原因分类的计数；警告和其他错误照常显示"""
     def filter(self, record):
-        return record.levelno <= self.max_level
+        return record.levelno < logging.ERROR or getattr(record, 'summary_key', None) is None
 
 def set_file_limit(limit: int) -> None:
     """设置文件描述符限制"""
@@ -50,22 +100,114 @@ def set_file_limit(limit: int) -> None:
 
 def parse_args():
     parser = argparse.ArgumentParser(description="持续TCP连接测试客户端（无限制版，实时显示）")
-    parser.add_argument('--server_ip', type=str, required=True, help='目标服务器的IP地址')
+    parser.add_argument('--server_ip', type=str, help='目标服务器的IP地址（代理模式下由控制器指定）')
     parser.add_argument('--server_port', type=int, default=9999, help='目标服务器的端口号（默认为9999）')
-    parser.add_argument('--interval', type=float, default=0.0001, help='每次连接尝试的间隔时间（秒，默认为0.0001秒）')
+    parser.add_argument('--interval', type=float, default=0.0001, help='每次连接尝试的间隔时间（秒，默认为0.0001秒），未指定 --rate 时速率为其倒数')
+    parser.add_argument('--rate', type=float, default=0, help='目标连接速率（连接/秒），指定后覆盖 --interval')
+    parser.add_argument('--ramp', type=str, default='constant', help=RAMP_HELP + '（默认为constant）')
     parser.add_argument('--report_interval', type=float, default=1.0, help='报告统计信息的间隔时间（秒，默认为1秒）')
     parser.add_argument('--error_log', type=str, default='error.log', help='错误日志文件名（默认为error.log）')
     parser.add_argument('--file-limit', type=int, default=65535, help='文件描述符限制（默认为65535）')
-    return parser.parse_args()
+    parser.add_argument('--max-connections', type=int, default=0, help='保持的目标连接数，0表示不限制（默认为0）')
+    parser.add_argument('--source-ips', type=str, default='',
+                        help='绑定的源地址列表，逗号分隔，支持 CIDR 和 起始-结束 范围（如 127.0.0.2-127.0.0.50）')
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING,
+                        help=f'同时处于握手阶段的最大连接数，本机资源耗尽时自动减小（默认为{MAX_PENDING}）')
+    parser.add_argument('--heartbeat-interval', type=float, default=HEARTBEAT_INTERVAL,
+                        help=f'每个连接的心跳间隔（秒），0表示只在连接建立时发送一次（默认为{HEARTBEAT_INTERVAL}秒）')
+    parser.add_argument('--message-size', type=int, default=0,
+                        help='吞吐量模式的消息大小（字节），连接建立后持续收发回显数据，0表示只发送心跳（默认为0）')
+    parser.add_argument('--pipeline', type=int, default=1,
+                        help='吞吐量模式和请求/响应模式下每个连接同时在途的消息数（默认为1）')
+    parser.add_argument('--request-size', type=int, default=0,
+                        help=f'请求/响应模式的请求大小（字节，至少{MIN_REQUEST_SIZE}），每个请求带序号和发送时间戳，'
+                             '连接建立后保持 --pipeline 个请求在途，报告请求速率和往返时间分位数；0表示不启用（默认为0）')
+    parser.add_argument('--churn', action='store_true',
+                        help='周转模式：每个连接建立后交换 --churn-bytes 字节回显数据，然后立即关闭，'
+                             '按 --rate 持续重复，--max-connections 限制同时进行的周期数')
+    parser.add_argument('--churn-bytes', type=int, default=0,
+                        help='周转模式下每个周期发送并等待回显的字节数（默认为0）')
+    parser.add_argument('--churn-server-close', type=float, default=0.0,
+                        help='周转模式下由服务端先关闭的周期比例（0~1），其余由客户端先关闭（默认为0）')
+    parser.add_argument('--duration', type=float, default=0, help='测试持续时间（秒），0表示一直运行（默认为0）')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='Prometheus 指标端点端口（GET /metrics），0表示不启用（默认为0）')
+    parser.add_argument('--engine', choices=ENGINES, default='asyncio',
+                        help='连接引擎：asyncio 每个连接一个协程；epoll 用非阻塞 connect_ex 和 epoll 批量处理，'
+                             '不创建协程，仅支持 Linux 且不支持吞吐量模式（默认为asyncio）')
+    parser.add_argument('--loop', choices=LOOP_BACKENDS, default='asyncio',
+                        help=f'{LOOP_HELP}（默认为asyncio）')
+    parser.add_argument('--shutdown-mode', choices=SHUTDOWN_MODES, default='graceful',
+                        help='结束时关闭连接的方式：graceful 正常关闭，abort 设置 SO_LINGER=0 直接发送 RST，不留 TIME_WAIT（默认为graceful）')
+    parser.add_argument('--shutdown-batch', type=int, default=SHUTDOWN_BATCH,
+                        help=f'结束时每批关闭的连接数（默认为{SHUTDOWN_BATCH}）')
+    parser.add_argument('--shutdown-timeout', type=float, default=SHUTDOWN_TIMEOUT,
+                        help=f'结束时关闭连接的时限（秒），超时后剩余连接直接中止（默认为{SHUTDOWN_TIMEOUT:g}）')
+    parser.add_argument('--socket-profile', choices=SOCKET_PROFILES, default='default',
+                        help=f'{SOCKET_PROFILE_HELP}；keepalive 和 lean 不再发送应用层心跳（默认为default）')
+    parser.add_argument('--workers', type=int, default=1, help='工作进程数，每个进程运行独立的事件循环（默认为1）')
+    parser.add_argument('--controller', type=str, default='',
+                        help=f'以控制器模式运行，在 [主机:]端口 上等待 --agents 个代理连接（如 {CONTROL_PORT}），'
+                             '分配速率和连接数、同步开始并汇总统计，本身不建立测试连接')
+    parser.add_argument('--agents', type=int, default=0, help='控制器模式下等待的代理数')
+    parser.add_argument('--agent', type=str, default='',
+                        help='以代理模式运行，连接到 主机:端口 上的控制器并按其分配的参数测试；'
+                             '目标地址、速率、连接数、心跳、消息大小和测试时长由控制器指定')
+    args = parser.parse_args()
+    if not args.server_ip and not args.agent:
+        parser.error("需要指定 --server_ip")
+    if args.controller and args.agent:
+        parser.error("--controller 与 --agent 不能同时使用")
+    if args.controller and args.agents < 1:
+        parser.error("控制器模式需要 --agents 至少为1")
+    try:
+        args.controller_address = parse_address(args.controller) if args.controller else None
+        args.agent_address = parse_address(args.agent, '') if args.agent else None
+    except ValueError as e:
+        parser.error(f"控制地址格式错误: {e}")
+    if args.agent_address and not args.agent_address[0]:
+        parser.error("--agent 需要指定控制器的 主机:端口")
+    if args.shutdown_batch < 1:
+        parser.error("--shutdown-batch 至少为1")
+    if args.workers < 1:
+        parser.error("--workers 至少为1")
+    if args.message_size < 0 or args.pipeline < 1:
+        parser.error("--message-size 不能为负数，--pipeline 至少为1")
+    if args.churn_bytes < 0 or not 0 <= args.churn_server_close <= 1:
+        parser.error("--churn-bytes 不能为负数，--churn-server-close 应在0到1之间")
+    if args.request_size and args.request_size < MIN_REQUEST_SIZE:
+        parser.error(f"--request-size 至少为{MIN_REQUEST_SIZE}")
+    if sum(map(bool, (args.churn, args.message_size, args.request_size))) > 1:
+        parser.error("周转模式（--churn）、吞吐量模式（--message-size）和请求/响应模式（--request-size）只能选一种")
+    if args.engine == 'epoll':
+        if not hasattr(select, 'epoll'):
+            parser.error("epoll 引擎仅支持 Linux")
+        if args.message_size:
+            parser.error("epoll 引擎不支持吞吐量模式（--message-size）")
+        if args.churn or args.request_size:
+            parser.error("epoll 引擎不支持周转模式（--churn）和请求/响应模式（--request-size）")
+    if args.interval <= 0 or args.rate < 0:
+        parser.error("--interval 必须大于0，--rate 不能为负数")
+    try:
+        args.ramp_profile = parse_ramp(args.ramp, args.rate or 1.0 / args.interval)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        args.source_ip_list = parse_source_ips(args.source_ips) if args.source_ips else []
+    except ValueError as e:
+        parser.error(str(e))
+    if args.ramp_profile.hold_at and not args.max_connections:
+        args.max_connections = args.ramp_profile.hold_at
+    return args
 
 def setup_logging(error_log_file):
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)  # 设置最低日志级别
 
-    # 创建控制台处理器，显示INFO及以下级别的日志
+    # 创建控制台处理器，显示INFO及以上级别的日志，逐连接的错误除外
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
-    console_handler.addFilter(MaxLevelFilter(logging.INFO))
+    console_handler.addFilter(ConsoleFilter())
     console_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     console_handler.setFormatter(console_formatter)
 
@@ -75,180 +217,691 @@ def setup_logging(error_log_file):
     file_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     file_handler.setFormatter(file_formatter)
 
-    # 添加处理器到日志记录器
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # 处理器在后台日志线程中执行，事件循环只把记录放入队列
+    start_queue_logging([console_handler, file_handler])
+
+@dataclass
+class ClientStats:
+    """客户端统计信息"""
+    success: int = 0
+    failure: int = 0
+    active: int = 0
+    pending: int = 0  # 正在握手的连接数
+    attempts: int = 0  # 已发起的连接数
+    target_rate: float = 0.0  # 当前目标连接速率
+    concurrency_limit: float = 0.0  # 当前允许同时握手的连接数
+    backoffs: int = 0  # 因本机资源耗尽而退避的次数
+    failures: Dict[str, int] = field(default_factory=dict)  # 按 errno 分类的失败次数
+    source_active: Dict[str, int] = field(default_factory=dict)  # 每个源地址的活动连接数
+    source_failures: Dict[str, int] = field(default_factory=dict)  # 每个源地址的失败次数
+    connect_latency: LatencyHistogram = field(default_factory=LatencyHistogram)  # 握手耗时
+    bytes_sent: int = 0  # 吞吐量模式发送的字节数
+    bytes_received: int = 0
+    messages: int = 0  # 吞吐量模式和请求/响应模式收到完整回显的消息数
+    loop_lag: LatencyHistogram = field(default_factory=LatencyHistogram)  # 事件循环延迟
+    cycles: int = 0  # 周转模式完成的建立/关闭周期数
+    client_closes: int = 0  # 其中由客户端先关闭的周期数
+    server_closes: int = 0  # 其中由服务端先关闭的周期数
+    teardown_latency: LatencyHistogram = field(default_factory=LatencyHistogram)  # 关闭握手耗时
+    rtt: LatencyHistogram = field(default_factory=LatencyHistogram)  # 请求/响应模式的往返时间
 
 class ConnectionManager:
-    def __init__(self):
-        self._connections = set()
-        self._lock = asyncio.Lock()
-        self._stats = {
-            'success': 0,
-            'failure': 0,
-            'active': 0
-        }
-        self._stats_lock = asyncio.Lock()
-
-    async def add_connection(self, writer: asyncio.StreamWriter) -> None:
-        async with self._lock:
-            self._connections.add(writer)
-            async with self._stats_lock:
-                self._stats['success'] += 1
-                self._stats['active'] += 1
-
-    async def remove_connection(self, writer: asyncio.StreamWriter) -> None:
-        async with self._lock:
-            if writer in self._connections:
-                self._connections.remove(writer)
-                async with self._stats_lock:
-                    self._stats['active'] -= 1
-
-    async def record_failure(self) -> None:
-        async with self._stats_lock:
-            self._stats['failure'] += 1
+    """连接登记与统计；所有方法都在事件循环线程中同步执行，无需加锁"""
+    def __init__(self, heartbeat_interval: float = HEARTBEAT_INTERVAL,
+                 max_pending: int = MAX_PENDING, source_ips: Optional[List[str]] = None,
+                 source_capacity: Optional[int] = None, message_size: int = 0, pipeline: int = 1,
+                 socket_profile: Optional[SocketProfile] = None, churn: Optional[ChurnPlan] = None,
+                 request_size: int = 0):
+        self._connections = ConnectionRegistry()
+        self.stats = ClientStats()
+        self.controller = ConcurrencyController(max_pending)
+        # 指定 --source-ips 时连接轮流绑定到各个源地址
+        self.sources = None
+        if source_ips:
+            self.sources = SourceAddressPool(source_ips, self.stats.source_active,
+                                             self.stats.source_failures, source_capacity)
+        # 吞吐量模式：所有连接共用同一个消息体，每个连接保持 pipeline 条消息在途
+        self.payload = bytes(message_size) if message_size else None
+        self.pipeline = pipeline
+        # 请求/响应模式：请求带序号和时间戳，同样保持 pipeline 个在途
+        self.request_size = request_size
+        # 周转模式：每个连接完成一个周期后关闭
+        self.churn = churn
+        # 所有连接的心跳由一个时间轮按批次发送，0 表示不发送心跳；
+        # 吞吐量和请求/响应模式下连接一直有数据收发，心跳会打乱消息边界，周转模式下连接不会保持，因此都不发送
+        if self.payload or request_size or churn:
+            heartbeat_interval = 0
+        self.heartbeat_interval = heartbeat_interval
+        self._heartbeats = TimerWheel(self._send_heartbeat)
+        # 需要在 connect 之前设置选项时自己创建套接字，目标地址由 connection_manager_task 解析一次
+        self.socket_profile = socket_profile if socket_profile and socket_profile.enabled else None
+        self.target: Optional[Tuple[int, tuple]] = None  # (地址族, 地址)
+        # 逐连接的失败日志先限速再格式化，大量连接被拒绝时超出部分只计数
+        self.failure_log = EventSampler('连接失败', DEFAULT_LOG_RATE)
+
+    def plan_launches(self, pacer: TokenBucketPacer, now: float,
+                      max_connections: int = 0) -> List[Optional[int]]:
+        """按令牌桶配额和握手并发上限决定本次发起的连接，返回每个连接绑定的源地址序号"""
+        stats = self.stats
+        stats.target_rate = pacer.current_rate(now)
+        stats.concurrency_limit = self.controller.limit
+        limit = self.controller.available(stats.pending, now)
+        if max_connections:
+            limit = min(limit, max_connections - stats.active - stats.pending)
+        count = pacer.take(now, limit)
+        if self.sources is None:
+            launches: List[Optional[int]] = [None] * count
+        else:
+            launches = []
+            for _ in range(count):
+                source = self.sources.pick(now)
+                if source is None:  # 所有源地址的端口都已用完
+                    pacer.tokens += count - len(launches)
+                    break
+                launches.append(source)
+        stats.attempts += len(launches)
+        return launches
+
+    def connection_opened(self, source: Optional[int] = None) -> None:
+        """握手成功后更新计数和并发控制器，两种引擎共用"""
+        self.controller.on_success()
+        self.stats.success += 1
+        self.stats.active += 1
+        if source is not None:
+            self.sources.connected(source)
+
+    def connection_closed(self, source: Optional[int] = None) -> None:
+        self.stats.active -= 1
+        if source is not None:
+            self.sources.disconnected(source)
+
+    def add_connection(self, writer: asyncio.StreamWriter, source: Optional[int] = None) -> int:
+        """登记连接并返回 conn_id"""
+        self.connection_opened(source)
+        conn_id = self._connections.add(writer, time.time())
+        if source is not None:
+            self._connections.source[conn_id] = source
+        if self.heartbeat_interval:
+            self._connections.timer[conn_id] = self._heartbeats.schedule(
+                conn_id, self.heartbeat_interval)
+        return conn_id
+
+    def remove_connection(self, conn_id: int, writer: asyncio.StreamWriter) -> None:
+        """注销连接，可以重复调用；连接断开时由 create_connection 调用，不做定期扫描"""
+        if self._connections.remove(conn_id, writer):
+            source = self._connections.source[conn_id]
+            self.connection_closed(source if source >= 0 else None)
+            if self.heartbeat_interval:
+                self._heartbeats.cancel(conn_id, self._connections.timer[conn_id])
+
+    def _send_heartbeat(self, conn_id: int) -> None:
+        """时间轮回调：发送心跳并登记下一次"""
+        writer = self._connections.conns[conn_id]
+        if writer is None or writer.is_closing():
+            return
+        writer.write(HEARTBEAT)
+        self._connections.timer[conn_id] = self._heartbeats.schedule(
+            conn_id, self.heartbeat_interval)
+
+    def record_failure(self, exc: BaseException, source: Optional[int] = None,
+                       now: Optional[float] = None) -> str:
+        """按 errno 记录一次连接失败，本机资源耗尽时触发退避；返回失败类别
+
+        now 与 plan_launches 使用同一时钟，默认取事件循环时间。
+        """
+        key, errno_value = classify_failure(exc)
+        stats = self.stats
+        stats.failure += 1
+        stats.failures[key] = stats.failures.get(key, 0) + 1
+        if now is None:
+            now = asyncio.get_running_loop().time()
+        if source is not None and self.sources.failed(source, errno_value, now):
+            return key  # 只是该源地址的端口用完，其他源地址仍可用，无需全局退避
+        if self.controller.on_failure(errno_value, now):
+            stats.backoffs += 1
+        return key
 
     def get_stats(self) -> dict:
-        return {
-            'success': self._stats['success'],
-            'failure': self._stats['failure'],
-            'active': self._stats['active']
-        }
+        return take_snapshot(self.stats)
 
-    def get_active_connections(self) -> set:
-        return self._connections.copy()
+    def get_active_connections(self) -> ConnectionRegistry:
+        """返回连接登记表本身（不复制），可以边遍历边注销"""
+        return self._connections
 
 async def create_connection(server_ip: str, server_port: int, 
-                          connection_manager: ConnectionManager) -> None:
+                          connection_manager: ConnectionManager,
+                          source: Optional[int] = None) -> None:
+    stats = connection_manager.stats
+    stats.pending += 1
+    local_addr = connection_manager.sources.local_addr(source) if source is not None else None
+    started = time.perf_counter()
     try:
-        reader, writer = await asyncio.open_connection(server_ip, server_port)
-        await connection_manager.add_connection(writer)
-        try:
+        reader, writer = await open_connection(server_ip, server_port, local_addr,
+                                               connection_manager)
+    except Exception as e:
+        # 只有握手阶段的错误计为连接失败，参与退避和源地址的失败统计
+        key = connection_manager.record_failure(e, source)
+        if connection_manager.failure_log.allow():
+            # 同一原因的失败在一个汇总周期内只输出第一条，其余合并计数
+            logging.error(f"连接到 {server_ip}:{server_port} 失败 ({key}): {e}",
+                          extra={'summary_key': f"连接到 {server_ip}:{server_port} 失败 ({key})"})
+        return
+    finally:
+        stats.pending -= 1
+    stats.connect_latency.record(time.perf_counter() - started)
+    conn_id = connection_manager.add_connection(writer, source)
+    try:
+        if connection_manager.payload:
+            await pump_messages(reader, writer, connection_manager)
+        elif connection_manager.request_size:
+            await pump_requests(reader, writer, connection_manager)
+        elif connection_manager.churn:
+            await run_cycle(reader, writer, connection_manager.churn, stats)
+        else:
+            # 连接建立后立即发送一次心跳，之后的心跳由 ConnectionManager 的时间轮发送
+            writer.write(HEARTBEAT)
+            await writer.drain()
             while True:
-                # 保持连接活跃
-                writer.write(b'ping')
-                await writer.drain()
                 data = await reader.read(100)
                 if not data:
                     break
-                await asyncio.sleep(60)  # 每分钟发送一次心跳
-        except Exception as e:
-            logging.error(f"连接维护时出错: {e}")
-        finally:
-            await connection_manager.remove_connection(writer)
-            writer.close()
-            await writer.wait_closed()
     except Exception as e:
-        await connection_manager.record_failure()
-        logging.error(f"连接到 {server_ip}:{server_port} 失败: {e}")
+        if connection_manager.failure_log.allow():
+            logging.error(f"连接维护时出错: {e}",
+                          extra={'summary_key': f"连接维护时出错: {type(e).__name__}"})
+    finally:
+        connection_manager.remove_connection(conn_id, writer)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception as e:
+            # 已建立的连接在关闭时被对端重置等，不是连接失败
+            logging.debug(f"关闭连接时出错: {e}")
+
+async def open_connection(server_ip: str, server_port: int, local_addr: Optional[tuple],
+                          connection_manager: ConnectionManager
+                          ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """建立连接；套接字配置需要在 connect 之前设置选项时自己创建套接字再交给 asyncio"""
+    profile = connection_manager.socket_profile
+    if profile is None:
+        return await asyncio.open_connection(server_ip, server_port, local_addr=local_addr)
+    family, address = connection_manager.target
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.setblocking(False)
+        profile.apply_connection(sock, bound=local_addr is not None)
+        if local_addr is not None:
+            sock.bind(local_addr)
+        await asyncio.get_running_loop().sock_connect(sock, address)
+    except BaseException:
+        sock.close()
+        raise
+    return await asyncio.open_connection(sock=sock)
+
+async def pump_messages(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                        connection_manager: ConnectionManager) -> None:
+    """吞吐量模式：保持 pipeline 条消息在途，每收到完整的回显就用 writelines 批量补发"""
+    stats = connection_manager.stats
+    payload = connection_manager.payload
+    size = len(payload)
+    writer.writelines(itertools.repeat(payload, connection_manager.pipeline))
+    stats.bytes_sent += size * connection_manager.pipeline
+    partial = 0  # 最后一条消息已收到的字节数
+    while True:
+        data = await reader.read(THROUGHPUT_READ_SIZE)
+        if not data or writer.is_closing():  # 退出时连接已被关闭，不再补发
+            break
+        stats.bytes_received += len(data)
+        completed, partial = divmod(partial + len(data), size)
+        if completed:
+            stats.messages += completed
+            writer.writelines(itertools.repeat(payload, completed))
+            stats.bytes_sent += size * completed
+            await writer.drain()
 
-async def verify_connections(connection_manager: ConnectionManager) -> None:
-    """定期验证连接状态"""
+async def pump_requests(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                        connection_manager: ConnectionManager) -> None:
+    """请求/响应模式：保持 pipeline 个请求在途，每收到完整的响应帧就校验序号、记录往返时间并补发"""
+    stats = connection_manager.stats
+    framer = RequestFramer(connection_manager.request_size)
+    size = framer.size
+    writer.writelines(framer.frames(connection_manager.pipeline))
+    stats.bytes_sent += size * connection_manager.pipeline
+    buffer = bytearray()  # 尚未凑成完整帧的响应数据
     while True:
-        for writer in list(connection_manager.get_active_connections()):
-            try:
-                if writer.is_closing():
-                    await connection_manager.remove_connection(writer)
-            except Exception as e:
-                logging.error(f"验证连接状态时出错: {e}")
-        await asyncio.sleep(30)
-
-async def report_status(connection_manager: ConnectionManager, report_interval: float) -> None:
+        data = await reader.read(THROUGHPUT_READ_SIZE)
+        if not data or writer.is_closing():  # 退出时连接已被关闭，不再补发
+            break
+        stats.bytes_received += len(data)
+        buffer += data
+        completed = len(buffer) // size
+        if completed:
+            framer.receive(buffer, completed, stats.rtt)
+            del buffer[:completed * size]
+            stats.messages += completed
+            writer.writelines(framer.frames(completed))
+            stats.bytes_sent += size * completed
+            await writer.drain()
+
+class StatusReporter:
+    """输出连接统计报告；记录上一次的快照以计算每个报告周期内的速率和延迟分位数
+
+    kernel_memory 为 False 时（控制器模式，连接不在本机）不报告内核 TCP 内存。
+    """
+    def __init__(self, socket_profile: str = 'default', kernel_memory: bool = True):
+        self._last_stats: dict = {}
+        self._last_time = time.monotonic()
+        self.socket_profile = socket_profile
+        self.kernel_memory = kernel_memory
+        self._kernel_baseline = read_kernel_memory() if kernel_memory else None
+
+    def log(self, stats: dict, census: Optional[dict], workers: int = 0, agents: int = 0) -> None:
+        """输出一次报告，workers/agents 非零时附带存活的工作进程数/代理数"""
+        now = time.monotonic()
+        elapsed = max(now - self._last_time, 1e-9)
+        last = self._last_stats
+        latency = stats.get('connect_latency') or LatencyHistogram()
+        interval_latency = latency.subtract(last.get('connect_latency') or LatencyHistogram())
+        attempt_rate = (stats.get('attempts', 0) - last.get('attempts', 0)) / elapsed
+        success_rate = (stats.get('success', 0) - last.get('success', 0)) / elapsed
+        loop_lag = stats.get('loop_lag') or LatencyHistogram()
+        interval_lag = loop_lag.subtract(last.get('loop_lag') or LatencyHistogram())
+        churn_line = ""
+        teardown = stats.get('teardown_latency')
+        if stats.get('cycles') or (teardown is not None and teardown.count):
+            interval_teardown = teardown.subtract(last.get('teardown_latency') or LatencyHistogram())
+            cycle_rate = (stats.get('cycles', 0) - last.get('cycles', 0)) / elapsed
+            time_wait = census.get('TIME_WAIT', 0) if census is not None else '未知'
+            churn_line = (f"\n连接周期: 完成 {stats.get('cycles', 0)} ({cycle_rate:.1f}/s), "
+                          f"客户端先关闭 {stats.get('client_closes', 0)}, "
+                          f"服务端先关闭 {stats.get('server_closes', 0)}, 本机 TIME_WAIT {time_wait}\n"
+                          f"关闭延迟(本周期): {format_latency(interval_teardown)}")
+        rtt_line = ""
+        rtt = stats.get('rtt')
+        if rtt is not None and rtt.count:
+            interval_rtt = rtt.subtract(last.get('rtt') or LatencyHistogram())
+            rtt_line = (f"\n请求/响应(本周期): {interval_rtt.count / elapsed:.1f} 请求/s, "
+                        f"往返时间 {format_latency(interval_rtt)}\n"
+                        f"往返时间(累计): {format_latency(rtt)}")
+        throughput_line = ""
+        if stats.get('bytes_sent'):
+            throughput = format_throughput(
+                stats.get('bytes_sent', 0) - last.get('bytes_sent', 0),
+                stats.get('bytes_received', 0) - last.get('bytes_received', 0),
+                stats.get('messages', 0) - last.get('messages', 0), elapsed)
+            throughput_line = f"\n吞吐量(本周期): {throughput}"
+        self._last_stats = stats
+        self._last_time = now
+
+        worker_line = f"\n存活工作进程: {workers}" if workers else ""
+        if agents:
+            worker_line += f"\n存活代理: {agents}"
+        sources = format_sources(stats.get('source_active') or {}, stats.get('source_failures') or {})
+        source_line = f"源地址连接数: {sources}\n" if sources else ""
+        failures = ', '.join(f"{key}={n}" for key, n in
+                             sorted((stats.get('failures') or {}).items(), key=lambda item: -item[1]))
+        kernel_line = ""
+        if self.kernel_memory:
+            kernel = format_kernel_memory(read_kernel_memory(), self._kernel_baseline,
+                                          stats.get('active', 0))
+            kernel_line = f"\n内核TCP内存(全系统): {kernel}"
+        logging.info(
+            f"连接统计:\n"
+            f"成功建立连接: {stats.get('success', 0)}\n"
+            f"失败次数: {stats.get('failure', 0)}{f' ({failures})' if failures else ''}\n"
+            f"当前活动连接: {stats.get('active', 0)}\n"
+            f"{format_census(census)}\n"
+            f"连接速率: 发起 {attempt_rate:.1f}/s, 成功 {success_rate:.1f}/s, "
+            f"目标 {stats.get('target_rate', 0):.1f}/s\n"
+            f"握手并发: 进行中 {stats.get('pending', 0)}, 上限 {stats.get('concurrency_limit', 0):.0f}, "
+            f"资源耗尽退避 {stats.get('backoffs', 0)} 次\n"
+            f"{source_line}"
+            f"握手延迟(本周期): {format_latency(interval_latency)}\n"
+            f"握手延迟(累计): {format_latency(latency)}\n"
+            f"事件循环延迟(本周期): {format_latency(interval_lag)}\n"
+            f"套接字配置: {self.socket_profile}"
+            f"{kernel_line}"
+            f"{churn_line}"
+            f"{throughput_line}"
+            f"{rtt_line}"
+            f"{worker_line}"
+        )
+
+async def report_status(connection_manager: ConnectionManager, report_interval: float,
+                        census: SocketCensus, socket_profile: str) -> None:
     """报告连接状态"""
+    reporter = StatusReporter(socket_profile)
     while True:
         try:
-            stats = connection_manager.get_stats()
-            established = 0
-            
-            # 尝试不同的方式获取系统连接数
-            try:
-                # 首先尝试 ss 命令（新系统常用）
-                result = subprocess.run(['ss', '-tn', 'state', 'established'], 
-                                     capture_output=True, text=True)
-                established = len(result.stdout.strip().split('\n')) - 1
-            except FileNotFoundError:
-                try:
-                    # 然后尝试 netstat 命令
-                    result = subprocess.run(['netstat', '-ant'], 
-                                         capture_output=True, text=True)
-                    established = result.stdout.count('ESTABLISHED')
-                except FileNotFoundError:
-                    # 如果都不可用，尝试读取 /proc/net/tcp（仅Linux系统）
-                    try:
-                        with open('/proc/net/tcp', 'r') as f:
-                            lines = f.readlines()[1:]  # 跳过标题行
-                            established = sum(1 for line in lines 
-                                           if line.split()[3] == '01')  # 01 表示 ESTABLISHED
-                    except FileNotFoundError:
-                        logging.warning("无法获取系统连接统计信息")
-                        established = "未知"
-            
-            logging.info(
-                f"连接统计:\n"
-                f"成功建立连接: {stats['success']}\n"
-                f"失败次数: {stats['failure']}\n"
-                f"当前活动连接: {stats['active']}\n"
-                f"系统ESTABLISHED连接: {established}"
-            )
+            reporter.log(connection_manager.get_stats(), await census.count_async())
         except Exception as e:
             logging.error(f"生成状态报告时出错: {e}")
         await asyncio.sleep(report_interval)
 
-async def main_async(server_ip: str, server_port: int, interval: float, 
-                     report_interval: float, semaphore: asyncio.Semaphore) -> None:
-    connection_manager = ConnectionManager()
+async def main_async(args: argparse.Namespace, profile: RampProfile, max_connections: int,
+                     stats_queue=None, worker_id: int = 0) -> None:
+    source_ips, source_capacity = worker_sources(args, worker_id)
+    socket_profile, heartbeat_interval = client_socket_profile(args)
+    churn = ChurnPlan(args.churn_bytes, args.churn_server_close) if args.churn else None
+    connection_manager = ConnectionManager(heartbeat_interval,
+                                           max(1, args.max_pending // args.workers),
+                                           source_ips, source_capacity,
+                                           args.message_size, args.pipeline, socket_profile, churn,
+                                           args.request_size)
+    logging.info(f"连接速率曲线: {profile.describe()}")
+    if churn:
+        logging.info(f"周转模式: {churn.describe()}")
+    if args.request_size:
+        logging.info(f"请求/响应模式: 请求大小 {args.request_size} 字节，每连接在途请求 {args.pipeline} 个")
+    if args.message_size:
+        logging.info(f"吞吐量模式: 消息大小 {args.message_size} 字节，每连接在途消息 {args.pipeline} 条")
 
     # 启动连接管理器
     manager_task = asyncio.create_task(
-        connection_manager_task(server_ip, server_port, interval, 
-                              connection_manager, semaphore)
+        connection_manager_task(args.server_ip, args.server_port, connection_manager,
+                                TokenBucketPacer(profile), max_connections)
     )
 
-    # 启动状态报告任务
-    reporter_task = asyncio.create_task(
-        report_status(connection_manager, report_interval)
-    )
+    # 启动状态报告任务；工作进程模式下改为把统计快照发送给父进程汇总
+    if stats_queue is not None:
+        reporter_task = asyncio.create_task(
+            publish_stats(stats_queue, worker_id, connection_manager.get_stats,
+                          args.report_interval)
+        )
+    else:
+        reporter_task = asyncio.create_task(
+            report_status(connection_manager, args.report_interval,
+                          SocketCensus(args.server_port, local=False), args.socket_profile)
+        )
 
-    # 启动连接验证任务
-    verify_task = asyncio.create_task(
-        verify_connections(connection_manager)
-    )
+    lag_task = asyncio.create_task(monitor_loop_lag(connection_manager.stats.loop_lag))
+    if args.metrics_port and stats_queue is None:
+        await start_metrics_server(METRICS_HOST, args.metrics_port, lambda: render_metrics(
+            connection_manager.get_stats(), CLIENT_METRICS, METRICS_PREFIX))
 
+    running = asyncio.gather(manager_task, reporter_task, lag_task)
+    stop_requested = asyncio.Event()
+
+    def handle_signal() -> None:
+        if not stop_requested.is_set():
+            logging.info("接收到关闭信号，测试结束")
+            stop_requested.set()
+            running.cancel()
+
+    install_stop_handler(handle_signal)  # 不支持时（Windows）仍由 KeyboardInterrupt 结束
+    started = time.monotonic()
     try:
-        await asyncio.gather(manager_task, reporter_task, verify_task)
+        await asyncio.wait_for(running, args.duration or None)
+    except asyncio.TimeoutError:
+        log_duration_reached(connection_manager, args.duration, time.monotonic() - started)
+    except asyncio.CancelledError:
+        if not stop_requested.is_set():
+            raise
     except Exception as e:
         logging.error(f"发生错误: {e}")
-        # 清理所有连接
-        for writer in connection_manager.get_active_connections():
-            writer.close()
+        running.cancel()
+    # 清理所有连接
+    shutdown = ShutdownPolicy(args.shutdown_batch, args.shutdown_timeout, args.shutdown_mode)
+    await shutdown.close(connection_manager.get_active_connections())
+    if stats_queue is not None:
+        # 最终快照在连接关闭之后发送，父进程的最后一次汇总反映关闭后的状态
+        stats_queue.put_nowait((worker_id, connection_manager.get_stats()))
+
+def client_socket_profile(args: argparse.Namespace) -> Tuple[SocketProfile, float]:
+    """返回套接字配置及实际使用的心跳间隔：启用内核 keepalive 时不再发送应用层心跳"""
+    profile = get_profile(args.socket_profile, listener=False)
+    heartbeat_interval = args.heartbeat_interval
+    if profile.keepalive and heartbeat_interval:
+        logging.info("由内核 TCP keepalive 检测连接存活，只在连接建立时发送一次心跳")
+        heartbeat_interval = 0
+    return profile, heartbeat_interval
+
+def log_duration_reached(connection_manager: ConnectionManager, duration: float,
+                         elapsed: float) -> None:
+    """测试时长到达时输出汇总"""
+    stats = connection_manager.get_stats()
+    summary = f"已达到测试时长 {duration:g}秒，成功建立连接 {stats['success']}"
+    if stats['bytes_sent']:
+        throughput = format_throughput(stats['bytes_sent'], stats['bytes_received'],
+                                       stats['messages'], elapsed)
+        summary += f"，平均吞吐量: {throughput}"
+    if stats['rtt'].count:
+        summary += f"，往返时间: {format_latency(stats['rtt'])}"
+    if stats['cycles']:
+        summary += (f"，完成周期 {stats['cycles']}（平均 {stats['cycles'] / elapsed:.1f}/s），"
+                    f"关闭延迟: {format_latency(stats['teardown_latency'])}")
+    logging.info(f"{summary}\n事件循环延迟(累计): {format_latency(stats['loop_lag'])}")
+
+def run_epoll(args: argparse.Namespace, profile: RampProfile, max_connections: int,
+              stats_queue=None, worker_id: int = 0) -> None:
+    """epoll 引擎入口：在当前线程中直接运行，不使用事件循环"""
+    from TCPConnTest_epoll import EpollConnectFlood
+
+    source_ips, source_capacity = worker_sources(args, worker_id)
+    socket_profile, heartbeat_interval = client_socket_profile(args)
+    # 心跳由 epoll 引擎自己发送，ConnectionManager 只负责统计、速率和并发控制
+    connection_manager = ConnectionManager(0, max(1, args.max_pending // args.workers),
+                                           source_ips, source_capacity)
+    flood = EpollConnectFlood(args.server_ip, args.server_port, connection_manager,
+                              TokenBucketPacer(profile), max_connections,
+                              HEARTBEAT, heartbeat_interval, socket_profile)
+    if stats_queue is not None:
+        def report() -> None:
+            stats_queue.put_nowait((worker_id, connection_manager.get_stats()))
+    else:
+        reporter = StatusReporter(args.socket_profile)
+        census = SocketCensus(args.server_port, local=False)
+
+        def report() -> None:
+            reporter.log(connection_manager.get_stats(), census.count_nowait())
+
+    if args.metrics_port and stats_queue is None:
+        start_metrics_thread(METRICS_HOST, args.metrics_port, lambda: render_metrics(
+            connection_manager.get_stats(), CLIENT_METRICS, METRICS_PREFIX))
+    logging.info(f"连接速率曲线: {profile.describe()}（epoll 引擎）")
+    # 工作进程被父进程或代理停止时收到 SIGTERM，与 Ctrl+C 一样关闭连接并发送最终快照
+    signal.signal(signal.SIGTERM, lambda signum, frame: flood.stop())
+    started = time.monotonic()
+    try:
+        flood.run(report, args.report_interval, args.duration)
+        if flood.stop_requested:
+            logging.info("接收到关闭信号，测试结束")
+        else:
+            log_duration_reached(connection_manager, args.duration, time.monotonic() - started)
+    finally:
+        flood.close(args.shutdown_mode == 'abort')
+        if stats_queue is not None:
+            stats_queue.put_nowait((worker_id, connection_manager.get_stats()))
 
-async def connection_manager_task(server_ip: str, server_port: int, interval: float,
+async def connection_manager_task(server_ip: str, server_port: int,
                                 connection_manager: ConnectionManager,
-                                semaphore: asyncio.Semaphore) -> None:
+                                pacer: TokenBucketPacer,
+                                max_connections: int = 0) -> None:
+    """按令牌桶配额批量发起连接；同时握手的连接数受 AIMD 控制器限制，
+    达到目标并发数后只补充断开的连接"""
+    loop = asyncio.get_running_loop()
+    stats = connection_manager.stats
+    if connection_manager.socket_profile is not None:
+        family, _, _, _, address = (await loop.getaddrinfo(server_ip, server_port,
+                                                           type=socket.SOCK_STREAM))[0]
+        connection_manager.target = (family, address)
+    started = loop.time()
+    target_reached = False
     while True:
-        async with semaphore:
+        now = loop.time()
+        if max_connections and not target_reached and stats.active >= max_connections:
+            target_reached = True
+            logging.info(f"已达到目标连接数 {max_connections}，用时 {now - started:.2f}秒")
+        for source in connection_manager.plan_launches(pacer, now, max_connections):
             asyncio.create_task(
-                create_connection(server_ip, server_port, connection_manager)
+                create_connection(server_ip, server_port, connection_manager, source)
             )
-        await asyncio.sleep(interval)
+        await asyncio.sleep(pacer.tick)
+
+def worker_sources(args: argparse.Namespace, worker_id: int) -> Tuple[Optional[List[str]], Optional[int]]:
+    """返回工作进程使用的源地址及每个地址的端口容量
+
+    源地址不少于工作进程数时按进程切分；否则所有进程共用，端口容量按进程数均分。
+    """
+    if not args.source_ip_list:
+        return None, None
+    addresses = args.source_ip_list
+    if args.workers <= 1:
+        return addresses, None
+    if len(addresses) >= args.workers:
+        return addresses[worker_id::args.workers], None
+    return addresses, max(1, local_port_capacity() // args.workers)
+
+def run_worker(worker_id: int, stats_queue, args: argparse.Namespace,
+               profile: RampProfile, max_connections: int) -> None:
+    """工作进程入口：运行独立的事件循环，负责一部分连接速率和连接数"""
+    if not restart_queue_logging():  # fork 模式下重启继承来的日志线程，spawn 模式下重新配置
+        setup_logging(args.error_log)
+    install_event_loop(args.loop)  # spawn 模式下不继承父进程的事件循环策略
+    try:
+        if args.engine == 'epoll':
+            run_epoll(args, profile, max_connections, stats_queue, worker_id)
+        else:
+            asyncio.run(main_async(args, profile, max_connections, stats_queue, worker_id))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_queue_logging()
+
+def run_multi_worker(args: argparse.Namespace, profile: Optional[RampProfile] = None,
+                     max_connections: Optional[int] = None, report=None, stop=None) -> None:
+    """多进程模式：按工作进程数切分连接速率和连接数，并汇总报告
+
+    代理模式下 report 改为把汇总快照发送给控制器，stop 为控制器要求停止时置位的事件。
+    """
+    if profile is None:
+        profile = args.ramp_profile
+    if max_connections is None:
+        max_connections = args.max_connections
+    worker_args = [(args, profile.scaled(1.0 / args.workers), share)
+                   for share in split_evenly(max_connections, args.workers)]
+    if report is None:
+        reporter = StatusReporter(args.socket_profile)
+        census = SocketCensus(args.server_port, local=False)
+
+        def report(stats: dict, workers: int) -> None:
+            # 最后一次汇总时工作进程都已退出，直接统计，其余时候不阻塞汇总循环
+            reporter.log(stats, census.count() if not workers else census.count_nowait(), workers)
+
+    def start_metrics(get_stats) -> None:
+        if args.metrics_port:
+            start_metrics_thread(METRICS_HOST, args.metrics_port, lambda: render_metrics(
+                get_stats(), CLIENT_METRICS, METRICS_PREFIX))
+
+    run_workers(run_worker, worker_args, report, args.report_interval, start_metrics,
+                args.shutdown_timeout + 5, stop)
+
+# 代理模式下由控制器统一指定的参数，其余参数（源地址、引擎、工作进程数等）仍取代理本地的命令行
+AGENT_PARAMS = ('server_ip', 'server_port', 'max_connections', 'heartbeat_interval',
+                'message_size', 'pipeline', 'duration', 'socket_profile', 'churn', 'churn_bytes',
+                'churn_server_close', 'request_size')
+EPOLL_MODE_ERROR = "不支持吞吐量、周转和请求/响应模式，请在代理上改用 asyncio 引擎"
+AGENT_PUBLISH_INTERVAL = 0.5  # 代理上报统计快照的间隔（秒），控制器按自己的 --report_interval 输出报告
+
+def run_controller(args: argparse.Namespace) -> None:
+    """控制器模式：等待代理连接，按代理数均分速率和连接数，同步开始并汇总报告"""
+    host, port = args.controller_address
+    controller = Controller(host, port, args.agents)
+    controller.accept_agents()
+
+    def make_params(agent_id: int, agents: int) -> dict:
+        params = {name: getattr(args, name) for name in AGENT_PARAMS}
+        params['max_connections'] = split_evenly(args.max_connections, agents)[agent_id]
+        profile = args.ramp_profile.scaled(1.0 / agents)
+        params['ramp_profile'] = {'kind': profile.kind, 'rate': profile.rate,
+                                  'duration': profile.duration, 'steps': profile.steps,
+                                  'hold_at': profile.hold_at}
+        return params
+
+    # 引擎由各代理的命令行决定，在分配参数前检查，避免部分代理已经就绪才发现不支持
+    epoll_agents = [link.name for link in controller.agents if link.engine == 'epoll']
+    if epoll_agents and (args.message_size or args.churn or args.request_size):
+        controller.cancel(None, f"代理 {', '.join(epoll_agents)} 使用 epoll 引擎，"
+                                f"{EPOLL_MODE_ERROR}")
+        controller.close()
+        sys.exit(1)
+    if not controller.start(make_params):
+        controller.close()
+        sys.exit(1)
+    logging.info(f"连接速率曲线（所有代理合计）: {args.ramp_profile.describe()}")
+    reporter = StatusReporter(args.socket_profile, kernel_memory=False)
+
+    def report(stats: dict, agents: int) -> None:
+        reporter.log(stats, None, agents=agents)
+
+    if args.metrics_port:
+        start_metrics_thread(METRICS_HOST, args.metrics_port, lambda: render_metrics(
+            controller.merged_stats(), CLIENT_METRICS, METRICS_PREFIX))
+    try:
+        try:
+            controller.run(report, args.report_interval)
+        except KeyboardInterrupt:
+            logging.info("正在通知所有代理停止...")
+            controller.stop_agents()
+            if not controller.run(report, args.report_interval, args.shutdown_timeout + 10):
+                logging.warning("部分代理未在时限内结束")
+    finally:
+        controller.close()
+    logging.info("所有代理已结束，汇总统计如下")
+    reporter.log(controller.merged_stats(), None)
+
+def run_agent(args: argparse.Namespace) -> None:
+    """代理模式：从控制器接收参数，同步开始后以本地工作进程运行测试并上报统计"""
+    host, port = args.agent_address
+    agent = Agent(host, port, f"{socket.gethostname()}:{os.getpid()}", args.engine)
+    try:
+        try:
+            config = agent.receive_config()
+            params = config['params']
+            for name in AGENT_PARAMS:
+                setattr(args, name, params[name])
+            profile = RampProfile(**params['ramp_profile'])
+            args.report_interval = AGENT_PUBLISH_INTERVAL
+            if args.engine == 'epoll' and (args.message_size or args.churn or args.request_size):
+                reason = f"代理使用 epoll 引擎，{EPOLL_MODE_ERROR}"
+                logging.error(reason)
+                agent.reject(reason)
+                sys.exit(1)
+            logging.info(f"代理 {config['agent_id'] + 1}/{config['agents']}: 目标 {args.server_ip}:{args.server_port}，"
+                         f"连接数 {args.max_connections or '不限'}，{profile.describe()}")
+            agent.wait_start()
+        except (ConnectionError, OSError, ValueError) as e:
+            logging.error(f"与控制器握手失败: {e}")
+            sys.exit(1)
+
+        def report(stats: dict, workers: int) -> None:
+            agent.publish(stats)
+
+        run_multi_worker(args, profile, args.max_connections, report, agent.stop_requested)
+    finally:
+        agent.close()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     args = parse_args()
     setup_logging(args.error_log)
+    args.loop = install_event_loop(args.loop)
+    logging.info(f"事件循环后端: {args.loop}")
 
     # 设置文件描述符限制
     set_file_limit(args.file_limit)
 
-    semaphore = asyncio.Semaphore(1000)  # 限制最大并发连接数
-
     try:
-        asyncio.run(main_async(
-            args.server_ip,
-            args.server_port,
-            args.interval,
-            args.report_interval,
-            semaphore
-        ))
+        if args.controller:
+            run_controller(args)
+        elif args.agent:
+            run_agent(args)
+        elif args.workers > 1:
+            run_multi_worker(args)
+        elif args.engine == 'epoll':
+            run_epoll(args, args.ramp_profile, args.max_connections)
+        else:
+            asyncio.run(main_async(args, args.ramp_profile, args.max_connections))
     except KeyboardInterrupt:
         logging.info("\n测试结束，正在关闭所有连接...")
         sys.exit(0)
@@ -0,0 +1,275 @@
+"""控制器/代理模式：一个控制器通过 TCP 控制连接协调多个客户端代理
+
+单个客户端进程（或单台机器）的源端口和 CPU 有限，达不到目标并发时，在多台
+机器上以代理模式运行客户端，由控制器统一分配速率和连接数、同步开始并汇总统计。
+控制协议是每行一个 JSON 对象：
+
+    代理 -> 控制器  {"type": "hello", "name": ..., "engine": ...}
+    控制器 -> 代理  {"type": "config", "agent_id": ..., "agents": ..., "params": {...}}
+    代理 -> 控制器  {"type": "ready"}
+    代理 -> 控制器  {"type": "error", "message": ...}  无法按参数运行时代替 ready 发送
+    控制器 -> 代理  {"type": "start"}            所有代理都就绪后同时发送
+    代理 -> 控制器  {"type": "stats", "stats": ...}  每个报告周期一次
+    控制器 -> 代理  {"type": "stop"}               开始前发送表示取消测试
+    代理关闭控制连接表示测试结束
+
+统计快照经 encode_snapshot 序列化，直方图以稀疏桶计数传输，控制器合并后
+得到与单进程相同精度的分位数。
+"""
+
+import json
+import logging
+import queue
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from TCPConnTest_stats import decode_snapshot, encode_snapshot, merge_snapshots
+
+CONTROL_PORT = 9900
+HANDSHAKE_TIMEOUT = 30.0  # 等待代理回复 hello/ready 的超时（秒）
+
+
+def parse_address(spec: str, default_host: str = '0.0.0.0') -> Tuple[str, int]:
+    """解析 [主机:]端口，格式错误时抛出 ValueError"""
+    host, sep, port = spec.rpartition(':')
+    if not sep:
+        host = default_host
+    port_number = int(port)
+    if not 0 < port_number < 65536:
+        raise ValueError(f"端口超出范围: {spec}")
+    return host or default_host, port_number
+
+
+def send_message(sock: socket.socket, message: Dict) -> None:
+    sock.sendall(json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n')
+
+
+class MessageReader:
+    """从控制连接逐行读取 JSON 消息"""
+
+    def __init__(self, sock: socket.socket):
+        self._file = sock.makefile('rb')
+
+    def read(self) -> Optional[Dict]:
+        """返回下一条消息，连接关闭时返回 None"""
+        try:
+            line = self._file.readline()
+        except OSError:
+            return None
+        if not line:
+            return None
+        return json.loads(line)
+
+    def expect(self, kind: str) -> Dict:
+        message = self.read()
+        if message is None:
+            raise ConnectionError(f"等待 {kind} 消息时控制连接已关闭")
+        if message.get('type') == 'error':
+            raise ConnectionError(f"对端报告错误: {message.get('message')}")
+        if message.get('type') == 'stop':
+            raise ConnectionError("控制器已取消测试")
+        if message.get('type') != kind:
+            raise ConnectionError(f"期望 {kind} 消息，收到 {message.get('type')}")
+        return message
+
+
+class AgentLink:
+    """控制器一侧的代理连接"""
+
+    def __init__(self, agent_id: int, sock: socket.socket, address):
+        self.agent_id = agent_id
+        self.sock = sock
+        self.reader = MessageReader(sock)
+        self.name = f"{address[0]}:{address[1]}"
+        self.engine = 'asyncio'  # 代理本地的连接引擎，由 hello 消息告知
+
+    def send(self, message: Dict) -> bool:
+        try:
+            send_message(self.sock, message)
+            return True
+        except OSError as e:
+            logging.error(f"向代理 {self.name} 发送消息失败: {e}")
+            return False
+
+
+class Controller:
+    """等待 expected 个代理连接，分配参数、同步开始并汇总各代理的统计快照"""
+
+    def __init__(self, host: str, port: int, expected: int):
+        self.expected = expected
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(expected)
+        self.agents: List[AgentLink] = []
+        self._messages: queue.Queue = queue.Queue()  # 各代理读线程收到的 (agent_id, 消息)
+        self._latest: Dict[int, Dict] = {}
+        self._finished: set = set()
+        logging.info(f"控制器监听 {host}:{port}，等待 {expected} 个代理连接")
+
+    def accept_agents(self) -> None:
+        while len(self.agents) < self.expected:
+            sock, address = self.listener.accept()
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            link = AgentLink(len(self.agents), sock, address)
+            sock.settimeout(HANDSHAKE_TIMEOUT)
+            try:
+                hello = link.reader.expect('hello')
+            except (ConnectionError, OSError, ValueError) as e:
+                logging.error(f"代理 {link.name} 握手失败: {e}")
+                sock.close()
+                continue
+            link.name = hello.get('name') or link.name
+            link.engine = hello.get('engine') or link.engine
+            self.agents.append(link)
+            logging.info(f"代理 {link.name} 已连接（{len(self.agents)}/{self.expected}）")
+        self.listener.close()
+
+    def start(self, make_params: Callable[[int, int], Dict]) -> bool:
+        """向每个代理发送参数，全部就绪后同时发出 start
+
+        make_params(agent_id, agents) 返回该代理的测试参数。有代理拒绝参数或断开时
+        通知其余代理取消测试并返回 False。
+        """
+        count = len(self.agents)
+        for link in self.agents:
+            if not link.send({'type': 'config', 'agent_id': link.agent_id, 'agents': count,
+                              'params': make_params(link.agent_id, count)}):
+                self.cancel(link, "发送参数失败")
+                return False
+        for link in self.agents:
+            try:
+                link.reader.expect('ready')
+            except (ConnectionError, OSError, ValueError) as e:
+                self.cancel(link, str(e))
+                return False
+            link.sock.settimeout(None)
+        for link in self.agents:
+            link.send({'type': 'start'})
+        logging.info(f"所有 {count} 个代理已就绪，同步开始测试")
+        for link in self.agents:
+            threading.Thread(target=self._read_agent, args=(link,),
+                             name=f"agent-{link.agent_id}", daemon=True).start()
+        return True
+
+    def _read_agent(self, link: AgentLink) -> None:
+        while True:
+            try:
+                message = link.reader.read()
+            except ValueError as e:
+                logging.error(f"代理 {link.name} 发送了无法解析的消息: {e}")
+                message = None
+            self._messages.put((link.agent_id, message))
+            if message is None:
+                return
+
+    def stop_agents(self, exclude: Optional[AgentLink] = None) -> None:
+        for link in self.agents:
+            if link is not exclude:
+                link.send({'type': 'stop'})
+
+    def cancel(self, failed: Optional[AgentLink], reason: str) -> None:
+        """测试开始前出错：记录原因并通知其余代理取消测试"""
+        prefix = f"代理 {failed.name} 未能就绪，" if failed is not None else ""
+        logging.error(f"{prefix}取消测试: {reason}")
+        self.stop_agents(exclude=failed)
+
+    def run(self, report: Callable[[Dict, int], None], report_interval: float,
+            timeout: Optional[float] = None) -> bool:
+        """汇总统计并按间隔调用 report(合并快照, 存活代理数)，直到所有代理结束
+
+        超过 timeout 秒仍有代理未结束时返回 False。
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        next_report = time.monotonic() + report_interval
+        while len(self._finished) < len(self.agents):
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return False
+            wait = next_report - now
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            try:
+                agent_id, message = self._messages.get(timeout=max(0.0, wait))
+                if message is None:
+                    self._finished.add(agent_id)
+                    logging.info(f"代理 {self.agents[agent_id].name} 已结束")
+                elif message.get('type') == 'stats':
+                    self._latest[agent_id] = decode_snapshot(message['stats'])
+            except queue.Empty:
+                pass
+            if time.monotonic() >= next_report:
+                try:
+                    report(self.merged_stats(), len(self.agents) - len(self._finished))
+                except Exception as e:
+                    logging.error(f"生成汇总报告时出错: {e}")
+                next_report += report_interval
+        return True
+
+    def merged_stats(self) -> Dict:
+        return merge_snapshots(list(self._latest.values()))  # 指标线程调用时主线程可能正在加入新的代理
+
+    def close(self) -> None:
+        for link in self.agents:
+            link.sock.close()
+
+
+class Agent:
+    """代理一侧的控制连接：接收参数、等待同步开始、上报统计快照"""
+
+    def __init__(self, host: str, port: int, name: str, engine: str = 'asyncio'):
+        self.sock = socket.create_connection((host, port), timeout=HANDSHAKE_TIMEOUT)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = MessageReader(self.sock)
+        self.stop_requested = threading.Event()
+        self._send_lock = threading.Lock()
+        send_message(self.sock, {'type': 'hello', 'name': name, 'engine': engine})
+        logging.info(f"已连接控制器 {host}:{port}，等待分配参数")
+
+    def receive_config(self) -> Dict:
+        self.sock.settimeout(None)  # 控制器可能要等其他代理连接
+        return self.reader.expect('config')
+
+    def reject(self, reason: str) -> None:
+        """无法按分配的参数运行：代替 ready 把原因告诉控制器"""
+        try:
+            send_message(self.sock, {'type': 'error', 'message': reason})
+        except OSError as e:
+            logging.error(f"向控制器发送错误信息失败: {e}")
+
+    def wait_start(self) -> None:
+        send_message(self.sock, {'type': 'ready'})
+        self.reader.expect('start')
+        threading.Thread(target=self._watch, name='control', daemon=True).start()
+
+    def _watch(self) -> None:
+        """控制器发送 stop 或断开连接时请求停止"""
+        while True:
+            try:
+                message = self.reader.read()
+            except ValueError:
+                continue
+            if message is None or message.get('type') == 'stop':
+                if message is None:
+                    logging.warning("与控制器的连接已断开，停止测试")
+                else:
+                    logging.info("控制器要求停止测试")
+                self.stop_requested.set()
+                return
+
+    def publish(self, stats: Dict) -> None:
+        with self._send_lock:
+            try:
+                send_message(self.sock, {'type': 'stats', 'stats': encode_snapshot(stats)})
+            except OSError as e:
+                logging.error(f"向控制器发送统计快照失败: {e}")
+
+    def close(self) -> None:
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
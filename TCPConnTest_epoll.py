@@ -0,0 +1,221 @@
+"""epoll 连接洪泛引擎：不创建协程，直接用非阻塞 connect_ex 发起连接、epoll 批量收取完成事件
+
+asyncio 引擎每个连接都要创建 Task、Future、StreamReader/StreamWriter，发起连接的
+速率往往受限于这些对象的开销。本引擎在单线程中循环：按令牌桶配额发起一批
+connect_ex，一次 epoll.poll 取回所有完成的握手和断开事件；连接只以 fd 为下标
+保存在扁平的表中。速率控制、统计和报告与 asyncio 引擎共用同一个 ConnectionManager。
+仅支持 Linux。
+"""
+
+import errno
+import logging
+import os
+import select
+import socket
+import time
+from array import array
+from collections import deque
+from typing import Callable, Optional
+
+from TCPConnTest_shutdown import LINGER_ZERO
+
+POLL_MAX_EVENTS = 4096  # 每次 poll 最多取回的事件数
+RECV_SIZE = 4096
+
+CONNECTING = 1
+ESTABLISHED = 2
+
+_CONNECT_PENDING = frozenset((0, errno.EINPROGRESS))
+_CLOSED_EVENTS = select.EPOLLERR | select.EPOLLHUP | getattr(select, 'EPOLLRDHUP', 0x2000)
+
+
+class EpollConnectFlood:
+    """epoll 连接引擎；manager 为客户端的 ConnectionManager，只使用其中的统计和控制部分，
+    socket_profile 为 TCPConnTest_sockopts 中的套接字配置"""
+
+    def __init__(self, server_ip: str, server_port: int, manager, pacer,
+                 max_connections: int = 0, heartbeat: bytes = b'ping',
+                 heartbeat_interval: float = 0, socket_profile=None):
+        family, _, _, _, address = socket.getaddrinfo(server_ip, server_port,
+                                                      type=socket.SOCK_STREAM)[0]
+        self.family = family
+        self.address = address
+        self.target = f"{server_ip}:{server_port}"
+        self.manager = manager
+        self.stats = manager.stats
+        self.pacer = pacer
+        self.max_connections = max_connections
+        self.heartbeat = heartbeat
+        self.heartbeat_interval = heartbeat_interval
+        self.socket_profile = socket_profile if socket_profile and socket_profile.enabled else None
+        self.epoll = select.epoll()
+        # fd 表：以文件描述符为下标的并行数组
+        self.socks: list = []
+        self.state = array('b')
+        self.started = array('d')  # 发起连接时的 perf_counter()
+        self.source = array('i')  # 源地址序号，-1 表示未绑定
+        self.serial = array('q')  # fd 被复用后用于识别过期的心跳
+        self._next_serial = 0
+        # 心跳间隔固定，按到期时间先后入队，队首总是最早到期的连接
+        self._heartbeats: deque = deque()
+        self.stop_requested = False
+
+    def _ensure_slot(self, fd: int) -> None:
+        missing = fd + 1 - len(self.socks)
+        if missing > 0:
+            self.socks.extend([None] * missing)
+            self.state.extend([0] * missing)
+            self.started.extend([0.0] * missing)
+            self.source.extend([-1] * missing)
+            self.serial.extend([0] * missing)
+
+    def _launch(self, source: Optional[int], now: float) -> None:
+        """发起一个非阻塞连接，由 EPOLLOUT 事件通知握手结果"""
+        stats = self.stats
+        sock = None
+        try:
+            sock = socket.socket(self.family, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            if self.socket_profile is not None:
+                self.socket_profile.apply_connection(sock, bound=source is not None)
+            if source is not None:
+                sock.bind(self.manager.sources.local_addr(source))
+            rc = sock.connect_ex(self.address)
+            if rc not in _CONNECT_PENDING:
+                raise OSError(rc, os.strerror(rc))
+            fd = sock.fileno()
+            self._ensure_slot(fd)
+            self.epoll.register(fd, select.EPOLLOUT)
+        except OSError as e:
+            if sock is not None:
+                sock.close()
+            self._failed(e, source, now)
+            return
+        self.socks[fd] = sock
+        self.state[fd] = CONNECTING
+        self.started[fd] = time.perf_counter()
+        self.source[fd] = -1 if source is None else source
+        stats.pending += 1
+
+    def _failed(self, exc: OSError, source: Optional[int], now: float) -> None:
+        key = self.manager.record_failure(exc, source, now)
+        if self.manager.failure_log.allow():
+            logging.error(f"连接到 {self.target} 失败 ({key}): {exc}",
+                          extra={'summary_key': f"连接到 {self.target} 失败 ({key})"})
+
+    def _release(self, fd: int) -> Optional[int]:
+        """从 fd 表和 epoll 中移除并关闭套接字，返回其源地址序号"""
+        sock = self.socks[fd]
+        try:
+            self.epoll.unregister(fd)
+        except OSError:
+            pass
+        sock.close()
+        self.socks[fd] = None
+        self.state[fd] = 0
+        source = self.source[fd]
+        return source if source >= 0 else None
+
+    def _on_connect(self, fd: int, now: float) -> None:
+        stats = self.stats
+        stats.pending -= 1
+        sock = self.socks[fd]
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            self._failed(OSError(err, os.strerror(err)), self._release(fd), now)
+            return
+        stats.connect_latency.record(time.perf_counter() - self.started[fd])
+        source = self.source[fd]
+        self.manager.connection_opened(source if source >= 0 else None)
+        self.state[fd] = ESTABLISHED
+        self.epoll.modify(fd, select.EPOLLIN | _CLOSED_EVENTS)
+        self._next_serial += 1
+        self.serial[fd] = self._next_serial
+        self._send_heartbeat(fd, now)
+
+    def _on_readable(self, fd: int) -> None:
+        """读取并丢弃服务器回显；对端关闭或出错时移除连接"""
+        try:
+            if self.socks[fd].recv(RECV_SIZE):
+                return
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            pass
+        self.manager.connection_closed(self._release(fd))
+
+    def _send_heartbeat(self, fd: int, now: float) -> None:
+        try:
+            self.socks[fd].send(self.heartbeat)
+        except OSError:
+            pass  # 发送缓冲区满或连接已断开；断开由 epoll 事件处理
+        if self.heartbeat_interval:
+            self._heartbeats.append((now + self.heartbeat_interval, fd, self.serial[fd]))
+
+    def _send_due_heartbeats(self, now: float) -> None:
+        heartbeats = self._heartbeats
+        while heartbeats and heartbeats[0][0] <= now:
+            _, fd, serial = heartbeats.popleft()
+            if self.state[fd] == ESTABLISHED and self.serial[fd] == serial:
+                self._send_heartbeat(fd, now)
+
+    def stop(self) -> None:
+        """请求 run() 在下一轮返回；只设置标志，可以在信号处理函数中调用"""
+        self.stop_requested = True
+
+    def run(self, report: Callable[[], None], report_interval: float,
+            duration: float = 0) -> None:
+        """运行直到 duration 秒后（0 表示一直运行）、stop() 被调用或被中断；
+        返回时连接仍保持打开，由 close() 关闭"""
+        stats = self.stats
+        manager = self.manager
+        pacer = self.pacer
+        state = self.state
+        started = time.monotonic()
+        next_report = started + report_interval
+        target_reached = False
+        while True:
+            now = time.monotonic()
+            if self.stop_requested or (duration and now - started >= duration):
+                break
+            if self.max_connections and not target_reached and stats.active >= self.max_connections:
+                target_reached = True
+                logging.info(f"已达到目标连接数 {self.max_connections}，用时 {now - started:.2f}秒")
+            for source in manager.plan_launches(pacer, now, self.max_connections):
+                self._launch(source, now)
+
+            events = self.epoll.poll(pacer.tick, POLL_MAX_EVENTS)
+            now = time.monotonic()
+            for fd, event in events:
+                if state[fd] == CONNECTING:
+                    self._on_connect(fd, now)
+                elif state[fd] == ESTABLISHED:
+                    self._on_readable(fd)
+
+            self._send_due_heartbeats(now)
+            # 没有事件循环可测延迟，记录每轮处理事件的耗时：新事件最多需要等待这么久才会被处理
+            stats.loop_lag.record(time.monotonic() - now)
+            if now >= next_report:
+                try:
+                    report()
+                except Exception as e:
+                    logging.error(f"生成状态报告时出错: {e}")
+                next_report += report_interval
+
+    def close(self, abort: bool = False) -> None:
+        """关闭所有套接字；abort 为 True 时先设置 SO_LINGER=0，关闭时直接发送 RST"""
+        for fd, sock in enumerate(self.socks):
+            if sock is not None:
+                if abort:
+                    try:
+                        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_ZERO)
+                    except OSError:
+                        pass
+                if self.state[fd] == CONNECTING:
+                    self.stats.pending -= 1
+                else:
+                    source = self.source[fd]
+                    self.manager.connection_closed(source if source >= 0 else None)
+                self._release(fd)
+        self._heartbeats.clear()
+        self.epoll.close()
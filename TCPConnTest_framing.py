@@ -0,0 +1,55 @@
+"""请求/响应帧：客户端在每个请求中写入序号和发送时间戳，服务端原样回显，客户端据此计算往返时间
+
+帧格式（网络字节序）：
+
+    uint32  帧长度（含帧头）
+    uint64  序号，每个连接从 0 开始递增
+    uint64  发送时间 time.perf_counter_ns()
+    填充    补零到帧长度
+
+回显服务端按字节原样写回，不需要理解帧格式；TCP 保证顺序，因此响应的序号必须与
+发送顺序一致，不一致说明数据被截断或错位。帧最短 20 字节，不会与 churn 模式的
+关闭请求混淆。时间戳只由发送方自己比较，两端不需要时钟同步。
+"""
+
+import struct
+import time
+from typing import List
+
+FRAME_HEADER = struct.Struct('!IQQ')
+MIN_REQUEST_SIZE = FRAME_HEADER.size
+
+
+class RequestFramer:
+    """一个连接上的请求帧编码与响应校验"""
+
+    __slots__ = ('size', '_padding', 'next_seq', 'expected_seq')
+
+    def __init__(self, size: int):
+        self.size = size
+        self._padding = bytes(size - FRAME_HEADER.size)
+        self.next_seq = 0  # 下一个请求的序号
+        self.expected_seq = 0  # 下一个响应应有的序号
+
+    def frames(self, count: int) -> List[bytes]:
+        """生成 count 个请求帧，时间戳取生成时刻"""
+        now = time.perf_counter_ns()
+        seq = self.next_seq
+        self.next_seq += count
+        pack, size, padding = FRAME_HEADER.pack, self.size, self._padding
+        return [pack(size, seq + i, now) + padding for i in range(count)]
+
+    def receive(self, buffer: bytearray, count: int, rtt) -> None:
+        """校验 buffer 开头 count 个完整响应帧并把往返时间记入 rtt 直方图
+
+        帧长度或序号不符时抛出 ConnectionError。
+        """
+        now = time.perf_counter_ns()
+        unpack, size = FRAME_HEADER.unpack_from, self.size
+        for i in range(count):
+            length, seq, sent = unpack(buffer, i * size)
+            if length != size or seq != self.expected_seq:
+                raise ConnectionError(f"响应帧错误: 长度 {length}（应为 {size}），"
+                                      f"序号 {seq}（应为 {self.expected_seq}）")
+            self.expected_seq += 1
+            rtt.record((now - sent) / 1e9)
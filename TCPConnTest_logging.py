@@ -0,0 +1,152 @@
+"""异步日志：事件循环线程只把日志记录放入队列，由后台监听线程写控制台和文件
+
+- 逐连接事件（建立、断开、超时）先经过 EventSampler 限速，超出部分只计数，
+  监听线程定期输出“省略了 N 条”的汇总；调用方在格式化消息前判断，被省略的
+  日志不产生任何格式化开销。
+- 带 extra={'summary_key': key} 的日志（如连接失败）在一个汇总周期内只输出
+  第一条，其余只计数，周期结束时输出“N× key”。
+"""
+
+import atexit
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Sequence
+
+SUMMARY_INTERVAL = 10.0  # 输出重复错误和省略日志汇总的间隔（秒）
+DEFAULT_LOG_RATE = 20  # 默认每秒最多输出的逐连接日志数
+
+_listener: Optional['SummarizingQueueListener'] = None
+_listener_pid = 0
+_samplers: List['EventSampler'] = []
+
+
+class EventSampler:
+    """逐连接日志限速器（令牌桶），只在事件循环线程中调用；rate 为 0 表示不限速"""
+
+    __slots__ = ('name', 'rate', 'tokens', 'last', 'suppressed')
+
+    def __init__(self, name: str, rate: float = DEFAULT_LOG_RATE):
+        self.name = name
+        self.rate = rate
+        self.tokens = float(rate)
+        self.last = time.monotonic()
+        self.suppressed = 0  # 累计省略的条数，只增不减，由监听线程计算增量
+        _samplers.append(self)
+
+    def allow(self) -> bool:
+        """本条日志是否输出"""
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.suppressed += 1
+        return False
+
+
+class SummarizingQueueListener(QueueListener):
+    """日志监听线程：把记录交给真正的处理器，合并重复错误并定期输出汇总"""
+
+    def __init__(self, log_queue, handlers: Sequence[logging.Handler],
+                 interval: float = SUMMARY_INTERVAL):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.interval = interval
+        self._repeats: Dict[str, list] = {}  # key -> [重复次数, 最近一条记录]
+        self._sampler_seen: Dict[int, int] = {}
+        self._window_start = time.monotonic()
+        self._next_flush = self._window_start + interval
+
+    def dequeue(self, block: bool):
+        while True:
+            timeout = self._next_flush - time.monotonic()
+            if timeout <= 0:
+                self.flush()
+                continue
+            try:
+                return self.queue.get(block, timeout)
+            except queue.Empty:
+                if not block:
+                    raise
+
+    def handle(self, record: logging.LogRecord) -> None:
+        key = getattr(record, 'summary_key', None)
+        if key is not None:
+            entry = self._repeats.get(key)
+            if entry is not None:
+                entry[0] += 1
+                entry[1] = record
+                return
+            self._repeats[key] = [0, record]  # 本周期第一次出现，立即输出
+        super().handle(record)
+
+    def _emit(self, record: logging.LogRecord, message: str) -> None:
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        super().handle(record)
+
+    def flush(self) -> None:
+        """输出本周期的重复错误和省略日志汇总"""
+        now = time.monotonic()
+        window = now - self._window_start  # 停止时最后一个周期可能不满 interval
+        self._window_start = now
+        self._next_flush = now + self.interval
+        repeats, self._repeats = self._repeats, {}
+        for key, (count, record) in repeats.items():
+            if count:
+                self._emit(record, f"{count}× {key}（最近 {window:.0f} 秒内重复，已合并）")
+        for sampler in list(_samplers):
+            seen = self._sampler_seen.get(id(sampler), 0)
+            suppressed = sampler.suppressed - seen
+            if suppressed > 0:
+                self._sampler_seen[id(sampler)] = sampler.suppressed
+                record = logging.LogRecord('root', logging.INFO, __file__, 0, '', None, None)
+                self._emit(record, f"最近 {window:.0f} 秒省略了 {suppressed} 条{sampler.name}日志"
+                                   f"（限速 {sampler.rate:g} 条/秒）")
+
+    def stop(self) -> None:
+        super().stop()
+        self.flush()
+
+
+def start_queue_logging(handlers: Sequence[logging.Handler],
+                        interval: float = SUMMARY_INTERVAL) -> SummarizingQueueListener:
+    """把根日志记录器的输出改为经队列交给监听线程，handlers 在监听线程中执行"""
+    global _listener, _listener_pid
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    log_queue = queue.SimpleQueue()
+    listener = SummarizingQueueListener(log_queue, handlers, interval)
+    listener.start()
+    root.addHandler(QueueHandler(log_queue))
+    if _listener is None:
+        atexit.register(stop_queue_logging)
+    _listener = listener
+    _listener_pid = os.getpid()
+    return listener
+
+
+def restart_queue_logging() -> bool:
+    """fork 出的子进程继承了 QueueHandler 却没有监听线程，用相同的处理器重新启动
+
+    不是由已配置队列日志的进程 fork 而来（如 spawn 模式）时返回 False。
+    """
+    if _listener is None:
+        return False
+    if _listener_pid != os.getpid():
+        start_queue_logging(_listener.handlers, _listener.interval)
+    return True
+
+
+def stop_queue_logging() -> None:
+    """停止监听线程并写出剩余日志；multiprocessing 的子进程退出时不执行 atexit，需要显式调用"""
+    if _listener is not None and _listener_pid == os.getpid() and _listener._thread is not None:
+        _listener.stop()
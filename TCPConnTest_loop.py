@@ -0,0 +1,53 @@
+"""事件循环后端：默认使用 asyncio 自带的事件循环，可选 uvloop
+
+uvloop 基于 libuv，建立和关闭大量连接时每个连接的循环开销明显更低。
+它是可选依赖（不支持 Windows），未安装时回退到 asyncio 并给出警告。
+monitor_loop_lag 测量事件循环延迟，用于判断回调是否阻塞了循环。
+"""
+
+import asyncio
+import logging
+from typing import List
+
+LOOP_BACKENDS = ('asyncio', 'uvloop')
+LOOP_HELP = '事件循环后端：asyncio 为默认实现，uvloop 需要先 pip install uvloop，未安装时回退到 asyncio'
+LAG_SAMPLE_INTERVAL = 0.1  # 测量事件循环延迟的间隔（秒）
+
+
+def backend_available(backend: str) -> bool:
+    """判断事件循环后端能否在当前环境中使用"""
+    if backend == 'uvloop':
+        try:
+            import uvloop  # noqa: F401
+        except ImportError:
+            return False
+    return backend in LOOP_BACKENDS
+
+
+def available_backends() -> List[str]:
+    return [backend for backend in LOOP_BACKENDS if backend_available(backend)]
+
+
+def install_event_loop(backend: str) -> str:
+    """为当前进程设置事件循环策略，之后的 asyncio.run 使用该后端；返回实际使用的后端"""
+    if backend == 'uvloop':
+        try:
+            import uvloop
+        except ImportError:
+            logging.warning("未安装 uvloop（pip install uvloop），回退到 asyncio 默认事件循环")
+            return 'asyncio'
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        return 'uvloop'
+    return 'asyncio'
+
+
+async def monitor_loop_lag(histogram, interval: float = LAG_SAMPLE_INTERVAL) -> None:
+    """持续测量事件循环延迟：sleep(interval) 比预期多出的时间就是其他回调占用循环的时间
+
+    histogram 为 LatencyHistogram，每次采样记录一次。
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        histogram.record(max(0.0, loop.time() - started - interval))
@@ -0,0 +1,116 @@
+"""Prometheus 指标端点：以文本格式导出统计快照中的计数器、瞬时值和直方图
+
+指标只由统计对象的快照生成（计数器在连接建立/断开时已经同步更新），抓取时
+不遍历连接登记表。使用事件循环的进程在同一个循环上提供 HTTP 服务；
+epoll 引擎和多进程模式的父进程没有事件循环，改用后台线程。
+
+指标说明以 (字段, 指标名, 类型, 说明[, 标签名]) 元组描述：类型为 counter、gauge
+或 histogram；字段为字典时按键展开为带标签的多个样本。
+"""
+
+import asyncio
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Sequence
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+HTTP_TIMEOUT = 5.0  # 读取请求头的超时（秒）
+# 直方图的 le 边界（秒）
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(name: str, histogram) -> List[str]:
+    lines = []
+    for bound, count in zip(LATENCY_BUCKETS, histogram.cumulative_counts(LATENCY_BUCKETS)):
+        lines.append(f'{name}_bucket{{le="{bound:g}"}} {count}')
+    lines.append(f'{name}_bucket{{le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum {histogram.total / 1000000:.6f}')
+    lines.append(f'{name}_count {histogram.count}')
+    return lines
+
+
+def render_metrics(stats: Dict, specs: Sequence[tuple], prefix: str) -> str:
+    """按指标说明把统计快照渲染为 Prometheus 文本格式"""
+    lines = []
+    for spec in specs:
+        field, name, kind, help_text = spec[:4]
+        label = spec[4] if len(spec) > 4 else None
+        value = stats.get(field)
+        if value is None:
+            continue
+        full_name = f"{prefix}_{name}"
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        if kind == 'histogram':
+            lines.extend(_histogram_lines(full_name, value))
+        elif label:
+            for key, n in sorted(value.items()):
+                lines.append(f'{full_name}{{{label}="{_escape(key)}"}} {n}')
+        else:
+            lines.append(f"{full_name} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def _response(status: str, body: bytes) -> bytes:
+    return (f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode() + body
+
+
+async def start_metrics_server(host: str, port: int, collect: Callable[[], str]):
+    """在当前事件循环上启动指标端点，GET /metrics 返回 collect() 的结果"""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), HTTP_TIMEOUT)
+            parts = request.split(b' ', 2)
+            path = parts[1].split(b'?', 1)[0] if len(parts) > 2 else b''
+            if path == b'/metrics':
+                writer.write(_response('200 OK', collect().encode('utf-8')))
+            else:
+                writer.write(_response('404 Not Found', b'not found\n'))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logging.error(f"处理指标请求时出错: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port, reuse_address=True)
+    logging.info(f"指标端点: http://{host}:{port}/metrics")
+    return server
+
+
+def start_metrics_thread(host: str, port: int, collect: Callable[[], str]) -> ThreadingHTTPServer:
+    """在后台线程中启动指标端点，用于没有事件循环的进程"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            try:
+                body = collect().encode('utf-8')
+            except Exception as e:
+                logging.error(f"处理指标请求时出错: {e}")
+                self.send_error(500)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # 不为每次抓取输出访问日志
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logging.info(f"指标端点: http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,155 @@
+"""连接速率与并发控制：令牌桶按目标速率批量发放连接配额，支持速率曲线；
+AIMD 控制器限制同时握手的连接数并在本机资源耗尽时退避
+
+事件循环无法精确地 sleep 0.0001 秒，逐个连接 sleep 的实际速率取决于负载。
+令牌桶在每个 tick 按经过的真实时间累积令牌，一次取出整数个令牌批量发起连接，
+即使唤醒延迟，平均速率仍然等于目标速率。
+"""
+
+import asyncio
+import errno
+from typing import Optional, Tuple
+
+PACER_TICK = 0.005  # 发放令牌的间隔（秒）
+MAX_BURST_TICKS = 20  # 唤醒延迟时最多补发多少个 tick 的令牌
+
+RAMP_HELP = ("连接速率曲线：constant（恒定速率）；linear:T（T秒内从0线性升到目标速率）；"
+             "step:K:T（分K级，每级持续T秒）；hold:N（全速建立到N个并发连接后保持，"
+             "等同于 --max-connections N）")
+
+
+class RampProfile:
+    """连接速率曲线，rate_at(elapsed) 返回开始后 elapsed 秒时的目标速率"""
+
+    def __init__(self, kind: str, rate: float, duration: float = 0.0,
+                 steps: int = 1, hold_at: int = 0):
+        self.kind = kind
+        self.rate = rate
+        self.duration = duration
+        self.steps = steps
+        self.hold_at = hold_at
+
+    def rate_at(self, elapsed: float) -> float:
+        if self.kind == 'linear' and elapsed < self.duration:
+            return self.rate * elapsed / self.duration
+        if self.kind == 'step':
+            step = int(elapsed // self.duration) + 1
+            if step < self.steps:
+                return self.rate * step / self.steps
+        return self.rate
+
+    def scaled(self, factor: float) -> 'RampProfile':
+        """按比例缩放速率（多进程时每个进程承担一部分）"""
+        return RampProfile(self.kind, self.rate * factor, self.duration, self.steps, self.hold_at)
+
+    def describe(self) -> str:
+        if self.kind == 'linear':
+            return f"{self.duration:g}秒内线性升至 {self.rate:g}/s"
+        if self.kind == 'step':
+            return f"分{self.steps}级升至 {self.rate:g}/s，每级 {self.duration:g}秒"
+        if self.kind == 'hold':
+            return f"{self.rate:g}/s 建立到 {self.hold_at} 个连接后保持"
+        return f"恒定 {self.rate:g}/s"
+
+
+def parse_ramp(spec: str, rate: float) -> RampProfile:
+    """解析 --ramp 参数，格式错误时抛出 ValueError"""
+    kind, _, rest = spec.partition(':')
+    params = rest.split(':') if rest else []
+    if kind == 'constant' and not params:
+        return RampProfile('constant', rate)
+    if kind == 'linear' and len(params) == 1 and float(params[0]) > 0:
+        return RampProfile('linear', rate, duration=float(params[0]))
+    if kind == 'step' and len(params) == 2 and int(params[0]) > 0 and float(params[1]) > 0:
+        return RampProfile('step', rate, duration=float(params[1]), steps=int(params[0]))
+    if kind == 'hold' and len(params) == 1 and int(params[0]) > 0:
+        return RampProfile('hold', rate, hold_at=int(params[0]))
+    raise ValueError(f"无法识别的速率曲线: {spec}")
+
+
+class TokenBucketPacer:
+    """令牌桶：take() 返回本次可以发起的连接数"""
+
+    def __init__(self, profile: RampProfile, tick: float = PACER_TICK):
+        self.profile = profile
+        self.tick = tick
+        self.tokens = 0.0
+        self._start: Optional[float] = None
+        self._last = 0.0
+
+    def current_rate(self, now: float) -> float:
+        if self._start is None:
+            return self.profile.rate_at(0.0)
+        return self.profile.rate_at(now - self._start)
+
+    def take(self, now: float, limit: Optional[int] = None) -> int:
+        """按经过的时间累积令牌并取出整数部分；limit 限制本次最多取出的数量"""
+        if self._start is None:
+            self._start = self._last = now
+        rate = self.current_rate(now)
+        burst = max(1.0, rate * self.tick * MAX_BURST_TICKS)
+        self.tokens = min(burst, self.tokens + rate * (now - self._last))
+        self._last = now
+        count = int(self.tokens)
+        if limit is not None and count > limit:
+            count = max(0, limit)
+        self.tokens -= count
+        return count
+
+
+# 本机资源耗尽：端口、文件描述符或内核缓冲区不足，继续发起连接只会更快地失败
+LOCAL_EXHAUSTION_ERRNOS = frozenset(
+    getattr(errno, name) for name in ('EADDRNOTAVAIL', 'EADDRINUSE', 'EMFILE', 'ENFILE', 'ENOBUFS', 'ENOMEM')
+    if hasattr(errno, name))
+
+MIN_BACKOFF = 0.05  # 首次退避暂停时间（秒）
+MAX_BACKOFF = 2.0
+DECREASE_COOLDOWN = 0.1  # 两次乘性减小之间的最小间隔，避免同一批失败把上限一次压到底
+
+
+def classify_failure(exc: BaseException) -> Tuple[str, Optional[int]]:
+    """返回 (失败类别, errno)，类别为 errno 名称（如 ECONNREFUSED）、TIMEOUT 或异常类型名"""
+    if isinstance(exc, OSError) and exc.errno:
+        return errno.errorcode.get(exc.errno, f"errno{exc.errno}"), exc.errno
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return 'TIMEOUT', None
+    return type(exc).__name__, None
+
+
+class ConcurrencyController:
+    """AIMD 并发控制：限制同时处于握手阶段的连接数
+
+    每次成功把上限加 1/limit（约每一轮握手加 1），本机资源耗尽类错误时上限减半
+    并暂停发起连接，暂停时间按指数退避，直到再次成功。
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = float(max_limit)
+        self.backoff = 0.0
+        self.paused_until = 0.0
+        self._last_decrease = float('-inf')
+
+    def available(self, in_flight: int, now: float) -> int:
+        """当前还可以发起的握手数"""
+        if now < self.paused_until:
+            return 0
+        return max(0, int(self.limit) - in_flight)
+
+    def on_success(self) -> None:
+        if self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        self.backoff = 0.0
+
+    def on_failure(self, errno_value: Optional[int], now: float) -> bool:
+        """记录一次失败，属于本机资源耗尽且不在冷却期内时执行退避并返回 True"""
+        if errno_value not in LOCAL_EXHAUSTION_ERRNOS:
+            return False
+        if now - self._last_decrease < DECREASE_COOLDOWN:
+            return False
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit / 2)
+        self.backoff = min(MAX_BACKOFF, self.backoff * 2) if self.backoff else MIN_BACKOFF
+        self.paused_until = now + self.backoff
+        return True
@@ -0,0 +1,79 @@
+"""紧凑的连接登记表：按连接编号索引的并行数组
+
+每个连接占用对象列表中的一个槽位和几个定长数组元素，不再为每个连接创建字典。
+删除时槽位置空并放入空闲栈，新连接优先复用，插入和删除都是 O(1)；
+遍历直接读取槽位列表，不复制集合。
+"""
+
+from array import array
+from typing import Any, Iterator, Optional, Tuple
+
+
+class ConnectionRegistry:
+    """连接登记表，conn_id 在连接存续期间保持不变"""
+
+    __slots__ = ('conns', 'connected_at', 'last_active', 'timer', 'source', 'bytes_received',
+                 'bytes_sent', '_free', '_count')
+
+    def __init__(self):
+        self.conns: list = []                 # 连接对象（StreamWriter 或协议对象），空槽为 None
+        self.connected_at = array('d')        # 建立时间（time.time()）
+        self.last_active = array('d')         # 最近一次收发数据的时间（loop.time()）
+        self.timer = array('q')               # 在时间轮中的目标 tick
+        self.source = array('i')              # 客户端源地址在地址池中的序号，-1 表示未绑定
+        self.bytes_received = array('q')
+        self.bytes_sent = array('q')
+        self._free = array('l')               # 空闲槽位栈
+        self._count = 0
+
+    def add(self, conn: Any, connected_at: float) -> int:
+        """登记连接并返回 conn_id"""
+        if self._free:
+            conn_id = self._free.pop()
+            self.conns[conn_id] = conn
+            self.connected_at[conn_id] = connected_at
+            self.last_active[conn_id] = 0.0
+            self.timer[conn_id] = 0
+            self.source[conn_id] = -1
+            self.bytes_received[conn_id] = 0
+            self.bytes_sent[conn_id] = 0
+        else:
+            conn_id = len(self.conns)
+            self.conns.append(conn)
+            self.connected_at.append(connected_at)
+            self.last_active.append(0.0)
+            self.timer.append(0)
+            self.source.append(-1)
+            self.bytes_received.append(0)
+            self.bytes_sent.append(0)
+        self._count += 1
+        return conn_id
+
+    def remove(self, conn_id: int, conn: Any) -> bool:
+        """注销连接；槽位已被注销或复用时返回 False，因此可以安全地重复调用"""
+        if conn_id is None or self.conns[conn_id] is not conn:
+            return False
+        self.conns[conn_id] = None
+        self._free.append(conn_id)
+        self._count -= 1
+        return True
+
+    def get(self, conn_id: int) -> Optional[Any]:
+        return self.conns[conn_id]
+
+    def items(self) -> Iterator[Tuple[int, Any]]:
+        """遍历 (conn_id, 连接)；遍历过程中可以注销连接"""
+        conns = self.conns
+        for conn_id in range(len(conns)):
+            conn = conns[conn_id]
+            if conn is not None:
+                yield conn_id, conn
+
+    def __iter__(self) -> Iterator[Any]:
+        return (conn for conn in self.conns if conn is not None)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def clear(self) -> None:
+        self.__init__()
@@ -4,13 +4,30 @@ import asyncio
 import logging
 import signal
 import argparse
-from typing import Set, Dict
-from dataclasses import dataclass
+from typing import Dict, Optional
+from dataclasses import dataclass, field
 import time
 import socket
-import subprocess
 import os
 import sys
+import multiprocessing
+
+from TCPConnTest_backlog import (DEFAULT_BACKLOG, AcceptQueueMonitor, format_accept_queue,
+                                 read_listen_counters, read_somaxconn)
+from TCPConnTest_census import SocketCensus, format_census, format_kernel_memory, read_kernel_memory
+from TCPConnTest_churn import CLOSE_REQUEST
+from TCPConnTest_logging import (DEFAULT_LOG_RATE, EventSampler, restart_queue_logging,
+                                 start_queue_logging, stop_queue_logging)
+from TCPConnTest_loop import LOOP_BACKENDS, LOOP_HELP, install_event_loop, monitor_loop_lag
+from TCPConnTest_metrics import render_metrics, start_metrics_server, start_metrics_thread
+from TCPConnTest_registry import ConnectionRegistry
+from TCPConnTest_shutdown import (SHUTDOWN_BATCH, SHUTDOWN_MODES, SHUTDOWN_TIMEOUT,
+                                  ShutdownPolicy, install_stop_handler)
+from TCPConnTest_sockopts import SOCKET_PROFILE_HELP, SOCKET_PROFILES, SocketProfile, get_profile
+from TCPConnTest_stats import (LatencyHistogram, format_latency, format_rss, format_throughput,
+                               get_rss_bytes, take_snapshot)
+from TCPConnTest_timerwheel import TimerWheel
+from TCPConnTest_workers import publish_stats, run_workers, split_evenly
 
 # 根据操作系统选择性导入 resource 模块
 if os.name != 'nt':  # 如果不是 Windows 系统
@@ -28,6 +45,23 @@ else:
     
     resource = DummyResource()
 
+REPORT_INTERVAL = 60  # 状态报告间隔（秒）
+STATS_PUBLISH_INTERVAL = 1.0  # 工作进程向父进程发送统计快照的间隔（秒）
+IDLE_TIMEOUT = 300  # 默认客户端空闲超时（秒）
+ECHO_BUFFER_SIZE = 65536  # 每次读取的最大字节数，吞吐量测试时越大每MB的系统调用越少
+ENGINES = ('stream', 'protocol')
+METRICS_PREFIX = 'tcpconntest_server'
+SERVER_METRICS = (
+    ('total_connections', 'connections_total', 'counter', '已接受的连接总数'),
+    ('active_connections', 'connections_active', 'gauge', '当前活动连接数'),
+    ('bytes_received', 'bytes_received_total', 'counter', '接收的字节数'),
+    ('bytes_sent', 'bytes_sent_total', 'counter', '发送的字节数'),
+    ('reads', 'echo_reads_total', 'counter', '回显的读取次数，TCP 合并的多条消息只计一次'),
+    ('close_requests', 'close_requests_total', 'counter', '应客户端请求主动关闭的连接数'),
+    ('rss_bytes', 'rss_bytes', 'gauge', '进程常驻内存（多进程时为各进程之和）'),
+    ('loop_lag', 'loop_lag_seconds', 'histogram', '事件循环延迟'),
+)
+
 @dataclass
 class ServerStats:
     """服务器统计信息"""
@@ -36,12 +70,118 @@ class ServerStats:
     active_connections: int = 0
     bytes_received: int = 0
     bytes_sent: int = 0
+    reads: int = 0  # 回显的读取次数（每次读取到的数据写回一次，不等于客户端的消息数）
+    close_requests: int = 0  # churn 模式下应客户端请求主动关闭的连接数
+    rss_baseline_bytes: int = 0  # 开始接受连接前的进程内存
+    loop_lag: LatencyHistogram = field(default_factory=LatencyHistogram)  # 事件循环延迟
+
+    def snapshot(self) -> Dict:
+        """返回可累加的计数器快照（不含启动时间），附带当前进程内存"""
+        snapshot = take_snapshot(self)
+        snapshot.pop('start_time')
+        snapshot['rss_bytes'] = get_rss_bytes()
+        return snapshot
+
+class EchoProtocol(asyncio.BufferedProtocol):
+    """protocol 引擎的回显连接
+
+    数据读入服务器共享的预分配缓冲区并直接写回，不为每条消息分配 bytes 对象；
+    每个连接只有几个槽位字段，没有 StreamReader/StreamWriter 和协程栈帧。
+    提供与 StreamWriter 相同的 close/is_closing/wait_closed/get_extra_info，
+    以便 TCPServer 的连接管理代码对两种引擎通用。
+    """
+    __slots__ = ('server', 'transport', 'conn_id', '_closed_waiter')
+
+    def __init__(self, server: 'TCPServer'):
+        self.server = server
+        self.transport = None
+        self.conn_id = None  # 在 TCPServer.clients 登记表中的编号
+        self._closed_waiter = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+        self.conn_id = self.server.register_client(self)
+        if self.conn_id is None:
+            transport.abort()
+            self.transport = None
+
+    def get_buffer(self, sizehint: int):
+        return self.server.echo_buffer
+
+    def buffer_updated(self, nbytes: int) -> None:
+        server = self.server
+        if nbytes == len(CLOSE_REQUEST) and server.echo_buffer[:nbytes] == CLOSE_REQUEST:
+            server.stats.close_requests += 1
+            self.transport.close()
+            return
+        data = memoryview(server.echo_buffer)[:nbytes]
+        self.transport.write(data)
+        if self.transport.get_write_buffer_size():
+            # 未能一次发完时传输层可能仍引用该缓冲区，换一块新的供后续读取
+            server.echo_buffer = bytearray(ECHO_BUFFER_SIZE)
+        clients = server.clients
+        clients.last_active[self.conn_id] = server.loop_time()
+        clients.bytes_received[self.conn_id] += nbytes
+        clients.bytes_sent[self.conn_id] += nbytes
+        stats = server.stats
+        stats.bytes_received += nbytes
+        stats.bytes_sent += nbytes
+        stats.reads += 1
+
+    def pause_writing(self) -> None:
+        # 对端读得慢时停止读取，避免写缓冲区无限增长
+        self.transport.pause_reading()
+
+    def resume_writing(self) -> None:
+        self.transport.resume_reading()
+
+    def connection_lost(self, exc) -> None:
+        if self.transport is None:
+            return
+        self.server.unregister_client(self.conn_id, self)
+        self.conn_id = None
+        if self._closed_waiter is not None and not self._closed_waiter.done():
+            self._closed_waiter.set_result(None)
+
+    def get_extra_info(self, name: str, default=None):
+        if self.transport is None:
+            return default
+        return self.transport.get_extra_info(name, default)
+
+    def is_closing(self) -> bool:
+        return self.transport is None or self.transport.is_closing()
+
+    def close(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
+
+    async def wait_closed(self) -> None:
+        if self.conn_id is None:
+            return
+        if self._closed_waiter is None:
+            self._closed_waiter = asyncio.get_running_loop().create_future()
+        await self._closed_waiter
 
 class TCPServer:
-    def __init__(self, host: str, port: int, max_clients: int = 10000):
+    def __init__(self, host: str, port: int, max_clients: int = 10000,
+                 stats_queue=None, worker_id: int = 0, engine: str = 'stream',
+                 idle_timeout: float = IDLE_TIMEOUT, metrics_port: int = 0,
+                 log_rate: float = DEFAULT_LOG_RATE, shutdown: Optional[ShutdownPolicy] = None,
+                 socket_profile: Optional[SocketProfile] = None, backlog: int = 0,
+                 accept_batch: int = 0):
         self.host = host
         self.port = port
         self.max_clients = max_clients
+        self.engine = engine
+        self.idle_timeout = idle_timeout  # 0 表示不检查空闲
+        self.metrics_port = metrics_port  # 0 表示不提供指标端点
+        # 连接建立、断开、超时日志按速率采样，大量连接涌入时不让日志拖慢事件循环
+        self.conn_log = EventSampler('连接事件', log_rate)
+        self.shutdown = shutdown or ShutdownPolicy()
+        self.socket_profile = socket_profile or SOCKET_PROFILES['default']
+        # 工作进程模式下统计信息发送给父进程汇总，不在本进程输出报告
+        self.stats_queue = stats_queue
+        self.worker_id = worker_id
         
         # 设置系统文件描述符限制
         try:
@@ -61,24 +201,81 @@ class TCPServer:
         except Exception as e:
             logging.warning(f"设置文件描述符限制失败: {e}")
 
+        # backlog 为 0 时按（可能已被调整的）最大连接数选择；accept_batch 为 0 时与 backlog 相同
+        self.backlog = backlog or min(self.max_clients, DEFAULT_BACKLOG)
+        self.accept_batch = accept_batch or self.backlog
         self.stats = ServerStats(start_time=time.time())
-        self.clients: Set[asyncio.StreamWriter] = set()
+        self.clients = ConnectionRegistry()  # StreamWriter 或 EchoProtocol
         self.server = None
-        self.client_info: Dict[asyncio.StreamWriter, Dict] = {}
+        self.metrics_server = None
         self.connection_limiter = asyncio.Semaphore(self.max_clients)
-        self._stats_lock = asyncio.Lock()
-        self._cleanup_lock = asyncio.Lock()
         self._shutdown = False  # 添加关闭标志
         self._tasks = set()  # 添加任务集合
+        self.census = SocketCensus(port, local=True)
+        self.echo_buffer = bytearray(ECHO_BUFFER_SIZE)  # protocol 引擎共享的读缓冲区
+        self.loop_time = None
+        # 所有连接的空闲超时由一个时间轮统一管理；收到数据只更新 last_active，
+        # 到期时再检查是否真的空闲，未空闲则按剩余时间重新登记
+        self.idle_wheel = TimerWheel(self._on_idle_deadline)
 
-    async def _update_stats(self, connection_added: bool = True) -> None:
-        """原子性地更新统计信息"""
-        async with self._stats_lock:
-            if connection_added:
-                self.stats.total_connections += 1
-                self.stats.active_connections += 1
-            else:
-                self.stats.active_connections -= 1
+    def _update_stats(self, connection_added: bool = True) -> None:
+        """更新连接统计；只在事件循环线程中同步调用，无需加锁"""
+        if connection_added:
+            self.stats.total_connections += 1
+            self.stats.active_connections += 1
+        else:
+            self.stats.active_connections -= 1
+
+    def register_client(self, conn) -> Optional[int]:
+        """登记新连接并返回 conn_id，超过最大连接数时返回 None"""
+        # 检查与登记之间没有 await，不会被其他协程打断
+        if len(self.clients) >= self.max_clients:
+            return None
+        clients = self.clients
+        conn_id = clients.add(conn, time.time())
+        clients.last_active[conn_id] = self.loop_time()
+        if self.idle_timeout:
+            clients.timer[conn_id] = self.idle_wheel.schedule(conn_id, self.idle_timeout)
+        self._update_stats(True)
+        if self.conn_log.allow():
+            logging.info(f"新连接来自 {conn.get_extra_info('peername')}，"
+                         f"当前活动连接数: {self.stats.active_connections}")
+        return conn_id
+
+    def unregister_client(self, conn_id: Optional[int], conn) -> None:
+        """注销连接并更新统计，可以重复调用
+
+        由连接断开事件触发（stream 引擎的 handle_client 退出、protocol 引擎的
+        connection_lost），不需要定期遍历所有连接；对端无声消失的连接由空闲超时
+        时间轮逐个到期关闭，随后同样经由断开事件注销。
+        """
+        clients = self.clients
+        if clients.remove(conn_id, conn):
+            if self.idle_timeout:
+                self.idle_wheel.cancel(conn_id, clients.timer[conn_id])
+            self._update_stats(False)
+            if self.conn_log.allow():
+                duration = time.time() - clients.connected_at[conn_id]
+                logging.info(
+                    f"客户端 {conn.get_extra_info('peername')} 断开连接。"
+                    f"连接持续时间: {duration:.2f}秒, "
+                    f"接收: {clients.bytes_received[conn_id]} 字节, "
+                    f"发送: {clients.bytes_sent[conn_id]} 字节"
+                )
+
+    def _on_idle_deadline(self, conn_id: int) -> None:
+        """时间轮回调：关闭空闲超时的连接"""
+        clients = self.clients
+        conn = clients.conns[conn_id]
+        if conn is None:
+            return
+        remaining = clients.last_active[conn_id] + self.idle_timeout - self.loop_time()
+        if remaining > 0:
+            clients.timer[conn_id] = self.idle_wheel.schedule(conn_id, remaining)
+            return
+        if self.conn_log.allow():
+            logging.warning(f"客户端 {conn.get_extra_info('peername')} 超时")
+        conn.close()  # stream 引擎的 reader.read() 随之返回，由 handle_client 完成清理
 
     async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
         """处理单个客户端连接"""
@@ -92,82 +289,58 @@ class TCPServer:
         
         async with self.connection_limiter:
             addr = writer.get_extra_info('peername')
+            conn_id = None
             
             try:
-                async with self._cleanup_lock:
-                    if len(self.clients) >= self.max_clients:  # 双重检查
-                        raise RuntimeError("超过最大连接数限制")
-                        
-                    self.clients.add(writer)
-                    await self._update_stats(True)
-                    self.client_info[writer] = {
-                        'connected_at': time.time(),
-                        'addr': addr,
-                        'bytes_received': 0,
-                        'bytes_sent': 0
-                    }
-                
-                logging.info(f"新连接来自 {addr}，当前活动连接数: {self.stats.active_connections}")
+                conn_id = self.register_client(writer)
+                if conn_id is None:  # 双重检查
+                    raise RuntimeError("超过最大连接数限制")
+                clients = self.clients
+                stats = self.stats
                 
                 while True:
-                    try:
-                        data = await asyncio.wait_for(reader.read(8192), timeout=300)
-                        if not data:
-                            break
-                        
-                        self.client_info[writer]['bytes_received'] += len(data)
-                        self.stats.bytes_received += len(data)
-                        
-                        writer.write(data)
-                        await writer.drain()
-                        
-                        self.client_info[writer]['bytes_sent'] += len(data)
-                        self.stats.bytes_sent += len(data)
-                        
-                    except asyncio.TimeoutError:
-                        logging.warning(f"客户端 {addr} 超时")
+                    # read() 返回的 bytes 原样交给 write()，传输层能一次发完时不再复制
+                    data = await reader.read(ECHO_BUFFER_SIZE)
+                    if not data:
                         break
-                        
+                    nbytes = len(data)
+                    if nbytes == len(CLOSE_REQUEST) and data == CLOSE_REQUEST:
+                        stats.close_requests += 1
+                        break  # churn 模式：由服务端主动关闭
+                    
+                    clients.last_active[conn_id] = self.loop_time()
+                    clients.bytes_received[conn_id] += nbytes
+                    stats.bytes_received += nbytes
+                    
+                    writer.write(data)
+                    await writer.drain()
+                    
+                    clients.bytes_sent[conn_id] += nbytes
+                    stats.bytes_sent += nbytes
+                    stats.reads += 1
+                    
             except ConnectionError:
-                logging.info(f"客户端 {addr} 断开连接")
+                if self.conn_log.allow():
+                    logging.info(f"客户端 {addr} 断开连接")
+            except asyncio.CancelledError:
+                # 只在事件循环退出时发生；正常结束，避免 StreamReaderProtocol 为每个连接输出异常
+                pass
             except Exception as e:
-                logging.error(f"处理客户端 {addr} 时出错: {e}", exc_info=True)
+                logging.error(f"处理客户端 {addr} 时出错: {e}", exc_info=True,
+                              extra={'summary_key': f"处理客户端连接时出错: {type(e).__name__}"})
             finally:
-                await self.cleanup_client(writer)
+                await self.cleanup_client(writer, conn_id)
 
-    async def cleanup_client(self, writer: asyncio.StreamWriter) -> None:
+    async def cleanup_client(self, writer: asyncio.StreamWriter, conn_id: Optional[int]) -> None:
         """清理客户端连接"""
-        async with self._cleanup_lock:
-            addr = writer.get_extra_info('peername')
-            if writer in self.clients:
-                self.clients.remove(writer)
-                await self._update_stats(False)
-                client_stats = self.client_info.pop(writer, {})
-                duration = time.time() - client_stats.get('connected_at', time.time())
-                logging.info(
-                    f"客户端 {addr} 断开连接。"
-                    f"连接持续时间: {duration:.2f}秒, "
-                    f"接收: {client_stats.get('bytes_received', 0)} 字节, "
-                    f"发送: {client_stats.get('bytes_sent', 0)} 字节"
-                )
-            try:
-                writer.close()
-                await writer.wait_closed()  # 等待连接完全关闭
-            except Exception as e:
-                logging.error(f"关闭连接 {addr} 时出错: {e}")
-
-    async def verify_connections(self) -> None:
-        """定期验证连接状态"""
-        while True:
-            async with self._cleanup_lock:
-                # 验证所有连接是否还有效
-                for writer in list(self.clients):
-                    try:
-                        if writer.is_closing():
-                            await self.cleanup_client(writer)
-                    except Exception as e:
-                        logging.error(f"验证连接状态时出错: {e}")
-            await asyncio.sleep(30)  # 每30秒检查一次
+        addr = writer.get_extra_info('peername')
+        self.unregister_client(conn_id, writer)
+        try:
+            writer.close()
+            await writer.wait_closed()  # 等待连接完全关闭
+        except Exception as e:
+            logging.error(f"关闭连接 {addr} 时出错: {e}",
+                          extra={'summary_key': f"关闭连接时出错: {type(e).__name__}"})
 
     async def start(self) -> None:
         """启动服务器"""
@@ -175,30 +348,66 @@ class TCPServer:
             return
             
         try:
-            self.server = await asyncio.start_server(
-                self.handle_client,
-                self.host,
-                self.port,
+            loop = asyncio.get_running_loop()
+            self.loop_time = loop.time
+            # asyncio 用同一个 backlog 参数决定 listen() 的队列长度和每次唤醒最多 accept 的连接数，
+            # 这里传入 accept_batch，开始服务后再对监听套接字重新 listen(backlog)
+            server_options = dict(
                 reuse_address=True,
                 reuse_port=hasattr(socket, 'SO_REUSEPORT'),
-                backlog=min(self.max_clients, 2048),  # 限制积压连接数
+                backlog=self.accept_batch,
                 start_serving=False  # 手动控制开始服务
             )
+            if self.engine == 'protocol':
+                self.server = await loop.create_server(
+                    lambda: EchoProtocol(self), self.host, self.port, **server_options)
+            else:
+                self.server = await asyncio.start_server(
+                    self.handle_client, self.host, self.port, **server_options)
+            # 只设置监听套接字，accept 得到的连接继承缓冲区大小和 keepalive 设置
+            for sock in self.server.sockets:
+                self.socket_profile.apply_listener(sock)
+            self.stats.rss_baseline_bytes = get_rss_bytes()
             
             # 启动后台任务
-            self._tasks.add(asyncio.create_task(self.report_stats()))
-            self._tasks.add(asyncio.create_task(self.verify_connections()))
+            if self.stats_queue is not None:
+                self._tasks.add(asyncio.create_task(
+                    publish_stats(self.stats_queue, self.worker_id,
+                                  self.stats.snapshot, STATS_PUBLISH_INTERVAL)))
+            else:
+                self._tasks.add(asyncio.create_task(self.report_stats()))
+            self._tasks.add(asyncio.create_task(monitor_loop_lag(self.stats.loop_lag)))
+            if self.metrics_port and self.stats_queue is None:
+                self.metrics_server = await start_metrics_server(
+                    self.host, self.metrics_port,
+                    lambda: render_metrics(self.stats.snapshot(), SERVER_METRICS, METRICS_PREFIX))
             
-            async with self.server:
-                await self.server.start_serving()
-                addrs = ', '.join(str(sock.getsockname()) for sock in self.server.sockets)
-                logging.info(f"服务器启动，监听地址: {addrs}")
-                
+            # 不使用 async with：退出时由 stop() 先关闭连接，再等待监听套接字关闭
+            await self.server.start_serving()
+            if self.accept_batch != self.backlog:
+                for sock in self.server.sockets:
+                    with sock.dup() as listener:  # dup 出的描述符指向同一个监听套接字
+                        listener.listen(self.backlog)
+            somaxconn = read_somaxconn()
+            if somaxconn is not None and self.backlog > somaxconn:
+                logging.warning(f"backlog {self.backlog} 超过 net.core.somaxconn={somaxconn}，"
+                                f"实际接受队列上限为 {somaxconn}")
+            if hasattr(socket, 'AF_NETLINK'):  # 接受队列只能通过 Linux 的 sock_diag 查询
                 try:
-                    await asyncio.Future()  # 永久等待，直到被取消
-                except asyncio.CancelledError:
-                    logging.info("服务器收到取消信号")
-                    raise
+                    inodes = {os.fstat(sock.fileno()).st_ino for sock in self.server.sockets}
+                except OSError:
+                    inodes = None  # 无法区分本进程的监听套接字时统计端口上的全部监听套接字
+                self._tasks.add(asyncio.create_task(
+                    AcceptQueueMonitor(self.census, inodes, self.worker_id == 0).run()))
+            addrs = ', '.join(str(sock.getsockname()) for sock in self.server.sockets)
+            logging.info(f"服务器启动（{self.engine} 引擎），监听地址: {addrs}，"
+                         f"接受队列上限 {self.backlog}，每次唤醒最多 accept {self.accept_batch} 个连接")
+            
+            try:
+                await asyncio.Future()  # 永久等待，直到被取消
+            except asyncio.CancelledError:
+                logging.info("服务器收到取消信号")
+                raise
                     
         except Exception as e:
             logging.error(f"服务器启动失败: {e}")
@@ -215,10 +424,9 @@ class TCPServer:
         # 1. 首先停止接受新连接
         if self.server:
             self.server.close()
-            try:
-                await self.server.wait_closed()
-            except Exception as e:
-                logging.error(f"关闭服务器时出错: {e}")
+
+        if self.metrics_server:
+            self.metrics_server.close()
 
         # 2. 取消所有后台任务
         for task in list(self._tasks):
@@ -231,108 +439,180 @@ class TCPServer:
                 except Exception as e:
                     logging.error(f"取消任务时出错: {e}")
         self._tasks.clear()
+        self.idle_wheel.stop()
 
-        # 3. 关闭所有现有客户端连接
+        # 3. 分批关闭所有现有客户端连接，由断开回调注销
         if self.clients:
-            close_tasks = []
-            for writer in list(self.clients):
-                try:
-                    if not writer.is_closing():
-                        writer.close()
-                        close_tasks.append(writer.wait_closed())
-                except Exception as e:
-                    logging.error(f"关闭客户端连接时出错: {e}")
-            
-            if close_tasks:
-                try:
-                    await asyncio.gather(*close_tasks, return_exceptions=True)
-                except Exception as e:
-                    logging.error(f"等待连接关闭时出错: {e}")
-            
-            self.clients.clear()
-            self.client_info.clear()
+            try:
+                await self.shutdown.close(self.clients, '客户端连接')
+            except Exception as e:
+                logging.error(f"关闭客户端连接时出错: {e}")
+            # 不清空登记表：超时被中止的连接随后仍会经由断开回调注销
 
+        # Python 3.12 起 wait_closed 会等待所有连接关闭，因此放在关闭连接之后
+        if self.server:
+            try:
+                await self.server.wait_closed()
+            except Exception as e:
+                logging.error(f"关闭服务器时出错: {e}")
+
+        if self.stats_queue is not None:
+            # 最终快照在连接关闭之后发送，父进程的最后一次汇总反映关闭后的状态
+            self.stats_queue.put_nowait((self.worker_id, self.stats.snapshot()))
         logging.info("服务器已完全关闭")
 
-    async def report_stats(self, interval: int = 60) -> None:
+    async def report_stats(self, interval: int = REPORT_INTERVAL) -> None:
         """定期报告服务器状态"""
+        reporter = ServerReporter(self.stats.start_time, self.socket_profile.name)
         while True:
             try:
-                # 尝试不同的方式获取连接统计
-                established = 0
-                try:
-                    # 首先尝试 ss 命令（新系统常用）
-                    result = subprocess.run(['ss', '-tn', 'state', 'established'], 
-                                         capture_output=True, text=True)
-                    established = len(result.stdout.strip().split('\n')) - 1
-                except FileNotFoundError:
-                    try:
-                        # 然后尝试 netstat 命令
-                        result = subprocess.run(['netstat', '-ant'], 
-                                             capture_output=True, text=True)
-                        established = result.stdout.count('ESTABLISHED')
-                    except FileNotFoundError:
-                        # 如果都不可用，使用 /proc/net/tcp
-                        try:
-                            with open('/proc/net/tcp', 'r') as f:
-                                lines = f.readlines()[1:]  # 跳过标题行
-                                established = sum(1 for line in lines 
-                                               if line.split()[3] == '01')  # 01 表示 ESTABLISHED
-                        except FileNotFoundError:
-                            logging.warning("无法获取系统连接统计信息")
-                
-                uptime = time.time() - self.stats.start_time
-                logging.info(
-                    f"服务器状态报告:\n"
-                    f"运行时间: {uptime:.2f}秒\n"
-                    f"总连接数: {self.stats.total_connections}\n"
-                    f"当前活动连接: {self.stats.active_connections}\n"
-                    f"系统ESTABLISHED连接: {established}\n"
-                    f"总接收字节: {self.stats.bytes_received}\n"
-                    f"总发送字节: {self.stats.bytes_sent}"
-                )
+                reporter.log(self.stats.snapshot(), await self.census.count_async(),
+                             accept_queue=await self.census.accept_queue_async())
             except Exception as e:
                 logging.error(f"生成状态报告时出错: {e}")
             
             await asyncio.sleep(interval)
 
+class ServerReporter:
+    """输出服务器状态报告；记录上一次的快照以计算每个报告周期内的吞吐量，
+    记录启动时的内核 TCP 内存作为计算每连接内核内存的基线"""
+    def __init__(self, start_time: float, socket_profile: str = 'default'):
+        self.start_time = start_time
+        self.socket_profile = socket_profile
+        self._kernel_baseline = read_kernel_memory()
+        self._listen_baseline = self._listen_last = read_listen_counters()
+        self._last_stats: Dict = {}
+        self._last_time = time.time()
+
+    def log(self, stats: Dict, census: Optional[Dict], workers: int = 0,
+            accept_queue: Optional[Dict] = None) -> None:
+        now = time.time()
+        last = self._last_stats
+        throughput = format_throughput(
+            stats.get('bytes_sent', 0) - last.get('bytes_sent', 0),
+            stats.get('bytes_received', 0) - last.get('bytes_received', 0),
+            stats.get('reads', 0) - last.get('reads', 0),
+            now - self._last_time, unit='读取')
+        loop_lag = stats.get('loop_lag') or LatencyHistogram()
+        interval_lag = loop_lag.subtract(last.get('loop_lag') or LatencyHistogram())
+        self._last_stats = stats
+        self._last_time = now
+        kernel = format_kernel_memory(read_kernel_memory(), self._kernel_baseline,
+                                      stats.get('active_connections', 0))
+        counters = read_listen_counters()
+        queue = format_accept_queue(accept_queue, counters, self._listen_last, self._listen_baseline)
+        self._listen_last = counters
+        log_stats_report(stats, now - self.start_time, census, workers, throughput,
+                         format_latency(interval_lag), self.socket_profile, kernel, queue)
+
+def log_stats_report(stats: Dict, uptime: float, census: Optional[Dict], workers: int = 0,
+                     throughput: str = "", loop_lag: str = "", socket_profile: str = "",
+                     kernel_memory: str = "", accept_queue: str = "") -> None:
+    """输出一次服务器状态报告，workers 非零时附带工作进程数"""
+    worker_line = f"\n存活工作进程: {workers}" if workers else ""
+    throughput_line = f"吞吐量(本周期): {throughput}\n" if throughput else ""
+    lag_line = f"事件循环延迟(本周期): {loop_lag}\n" if loop_lag else ""
+    profile_line = f"套接字配置: {socket_profile}\n" if socket_profile else ""
+    close_line = (f"应请求主动关闭的连接: {stats['close_requests']}\n"
+                  if stats.get('close_requests') else "")
+    kernel_line = f"\n内核TCP内存(全系统): {kernel_memory}" if kernel_memory else ""
+    queue_line = f"接受队列: {accept_queue}\n" if accept_queue else ""
+    rss = format_rss(stats.get('rss_bytes', 0), stats.get('rss_baseline_bytes', 0),
+                     stats.get('active_connections', 0))
+    logging.info(
+        f"服务器状态报告:\n"
+        f"运行时间: {uptime:.2f}秒\n"
+        f"总连接数: {stats.get('total_connections', 0)}\n"
+        f"当前活动连接: {stats.get('active_connections', 0)}\n"
+        f"{format_census(census)}\n"
+        f"{queue_line}"
+        f"总接收字节: {stats.get('bytes_received', 0)}\n"
+        f"总发送字节: {stats.get('bytes_sent', 0)}\n"
+        f"{throughput_line}"
+        f"{close_line}"
+        f"{lag_line}"
+        f"{profile_line}"
+        f"进程内存: {rss}"
+        f"{kernel_line}"
+        f"{worker_line}"
+    )
+
 def parse_args() -> argparse.Namespace:
     """解析命令行参数"""
     parser = argparse.ArgumentParser(description="异步TCP服务器")
     parser.add_argument('--host', default='0.0.0.0', help='监听地址')
     parser.add_argument('--port', type=int, default=9998, help='监听端口')
     parser.add_argument('--max-clients', type=int, default=10000, help='最大客户端连接数')
-    return parser.parse_args()
+    parser.add_argument('--engine', choices=ENGINES, default='stream',
+                        help='连接处理引擎：stream 使用 StreamReader/Writer，protocol 使用 BufferedProtocol 以减少每连接内存（默认为stream）')
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT,
+                        help=f'客户端空闲超时时间（秒），0表示不超时（默认为{IDLE_TIMEOUT}）')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='Prometheus 指标端点端口（GET /metrics），0表示不启用（默认为0）')
+    parser.add_argument('--loop', choices=LOOP_BACKENDS, default='asyncio',
+                        help=f'{LOOP_HELP}（默认为asyncio）')
+    parser.add_argument('--log-rate', type=float, default=DEFAULT_LOG_RATE,
+                        help=f'每个进程每秒最多输出的连接建立/断开/超时日志条数，超出部分定期汇总，0表示不限制（默认为{DEFAULT_LOG_RATE}）')
+    parser.add_argument('--shutdown-mode', choices=SHUTDOWN_MODES, default='graceful',
+                        help='退出时关闭连接的方式：graceful 正常关闭，abort 设置 SO_LINGER=0 直接发送 RST，不留 TIME_WAIT（默认为graceful）')
+    parser.add_argument('--shutdown-batch', type=int, default=SHUTDOWN_BATCH,
+                        help=f'退出时每批关闭的连接数，批与批之间让出事件循环（默认为{SHUTDOWN_BATCH}）')
+    parser.add_argument('--shutdown-timeout', type=float, default=SHUTDOWN_TIMEOUT,
+                        help=f'退出时关闭连接的时限（秒），超时后剩余连接直接中止（默认为{SHUTDOWN_TIMEOUT:g}）')
+    parser.add_argument('--backlog', type=int, default=0,
+                        help=f'listen() 的接受队列长度，受 net.core.somaxconn 限制，0表示取 min(最大连接数, {DEFAULT_BACKLOG})（默认为0）')
+    parser.add_argument('--accept-batch', type=int, default=0,
+                        help='asyncio 事件循环每次被唤醒时最多 accept 的连接数，0表示与 --backlog 相同（默认为0）；'
+                             'uvloop 每次都 accept 到队列为空，不受此参数影响')
+    parser.add_argument('--socket-profile', choices=SOCKET_PROFILES, default='default',
+                        help=f'{SOCKET_PROFILE_HELP}；keepalive 和 lean 不再检查空闲超时（默认为default）')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='工作进程数，多个进程通过 SO_REUSEPORT 监听同一端口（默认为1）')
+    args = parser.parse_args()
+    if args.shutdown_batch < 1:
+        parser.error("--shutdown-batch 至少为1")
+    if args.backlog < 0 or args.accept_batch < 0:
+        parser.error("--backlog 和 --accept-batch 不能为负数")
+    if args.idle_timeout < 0:
+        parser.error("--idle-timeout 不能为负数")
+    return args
 
-async def main() -> None:
+def setup_logging() -> None:
+    """配置日志：事件循环只把记录放入队列，由后台线程写出"""
+    logging.getLogger().setLevel(logging.INFO)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s',
+                                           datefmt='%Y-%m-%d %H:%M:%S'))
+    start_queue_logging([handler])
+
+async def main(args: argparse.Namespace, max_clients: int,
+               stats_queue=None, worker_id: int = 0) -> None:
     """主函数"""
-    args = parse_args()
-    
-    # 配置日志
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
-    server = TCPServer(args.host, args.port, args.max_clients)
+    shutdown = ShutdownPolicy(args.shutdown_batch, args.shutdown_timeout, args.shutdown_mode)
+    socket_profile = get_profile(args.socket_profile, listener=True)
+    idle_timeout = args.idle_timeout
+    if socket_profile.keepalive and idle_timeout:
+        logging.info("由内核 TCP keepalive 检测失效连接，不再检查空闲超时")
+        idle_timeout = 0
+    server = TCPServer(args.host, args.port, max_clients, stats_queue, worker_id, args.engine,
+                       idle_timeout, args.metrics_port, args.log_rate, shutdown, socket_profile,
+                       args.backlog, args.accept_batch)
+    main_task = asyncio.current_task()
+    stopping = False
     
     def handle_signal():
         """处理信号"""
-        if not server._shutdown:  # 防止重复处理信号
+        nonlocal stopping
+        if not stopping and not server._shutdown:  # 防止重复处理信号
+            stopping = True
             logging.info("接收到关闭信号，正在关闭服务器...")
-            # 取消当前运行的任务
-            for task in asyncio.all_tasks():
-                if task is not asyncio.current_task():
-                    task.cancel()
+            # 只取消主任务，由 server.stop() 分批关闭连接；不逐个取消连接任务
+            main_task.cancel()
 
     # 设置信号处理
-    loop = asyncio.get_running_loop()
-    for sig in (signal.SIGTERM, signal.SIGINT):
-        try:
-            loop.add_signal_handler(sig, handle_signal)
-        except NotImplementedError:
-            # Windows 系统使用备用方案
+    if not install_stop_handler(handle_signal):
+        # Windows 系统使用备用方案
+        for sig in (signal.SIGTERM, signal.SIGINT):
             signal.signal(sig, lambda s, f: handle_signal())
     
     try:
@@ -345,8 +625,49 @@ async def main() -> None:
         logging.error(f"服务器运行时出错: {e}", exc_info=True)
         await server.stop()
 
+def run_worker(worker_id: int, stats_queue, args: argparse.Namespace,
+               max_clients: int) -> None:
+    """工作进程入口：运行一个监听同一端口的 TCPServer"""
+    if not restart_queue_logging():  # fork 模式下重启继承来的日志线程，spawn 模式下重新配置
+        setup_logging()
+    install_event_loop(args.loop)  # spawn 模式下不继承父进程的事件循环策略
+    try:
+        asyncio.run(main(args, max_clients, stats_queue, worker_id))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_queue_logging()
+
+def run_multi_worker(args: argparse.Namespace) -> None:
+    """多进程模式：由内核在各工作进程间分发连接，父进程汇总统计信息"""
+    reporter = ServerReporter(time.time(), args.socket_profile)
+    census = SocketCensus(args.port, local=True)
+
+    def report(stats: Dict, workers: int) -> None:
+        reporter.log(stats, census.count(), workers, census.accept_queue())
+
+    def start_metrics(get_stats) -> None:
+        if args.metrics_port:
+            start_metrics_thread(args.host, args.metrics_port,
+                                 lambda: render_metrics(get_stats(), SERVER_METRICS, METRICS_PREFIX))
+
+    worker_args = [(args, share) for share in split_evenly(args.max_clients, args.workers)]
+    run_workers(run_worker, worker_args, report, REPORT_INTERVAL, start_metrics,
+                args.shutdown_timeout + 5)
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    args = parse_args()
+    setup_logging()
+    args.loop = install_event_loop(args.loop)
+    logging.info(f"事件循环后端: {args.loop}")
     try:
-        asyncio.run(main())
+        if args.workers > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+            logging.warning("当前系统不支持 SO_REUSEPORT，以单进程模式运行")
+            args.workers = 1
+        if args.workers > 1:
+            run_multi_worker(args)
+        else:
+            asyncio.run(main(args, args.max_clients))
     except KeyboardInterrupt:
         pass  # 优雅地处理 Ctrl+C
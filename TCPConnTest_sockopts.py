@@ -0,0 +1,121 @@
+"""套接字配置：按预设的配置设置每个连接的内核参数，用于比较每连接的内核内存占用
+
+    default    不设置任何选项（内核默认缓冲区，客户端发送应用层心跳）
+    nodelay    TCP_NODELAY
+    keepalive  nodelay + 内核 TCP keepalive，代替应用层心跳检测对端存活
+    lean       keepalive + 最小的 SO_RCVBUF/SO_SNDBUF；服务器监听套接字设置
+               TCP_DEFER_ACCEPT，客户端绑定源地址时设置 IP_BIND_ADDRESS_NO_PORT
+
+服务器只设置监听套接字：Linux 下 accept 得到的连接继承监听套接字的缓冲区大小和
+keepalive 设置，不需要逐个连接调用 setsockopt。客户端在 connect 之前设置，缓冲区
+大小在握手时就决定了通告的窗口。设置 SO_RCVBUF/SO_SNDBUF 后内核不再自动调整缓冲区，
+适合大量空闲连接，不适合吞吐量测试。当前平台不支持的选项会被跳过并在启动时提示。
+"""
+
+import logging
+import socket
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+KEEPALIVE_IDLE = 60  # 连接空闲多久后开始发送 keepalive 探测（秒）
+KEEPALIVE_INTERVAL = 10  # 探测间隔（秒）
+KEEPALIVE_COUNT = 5  # 连续多少次探测无响应后断开
+LEAN_BUFFER_SIZE = 4096  # lean 配置的收发缓冲区大小（字节），内核会将其翻倍并限制下限
+DEFER_ACCEPT_TIMEOUT = 5  # TCP_DEFER_ACCEPT：握手完成后最多等待首个数据的时间（秒）
+
+# Linux 的 IP_BIND_ADDRESS_NO_PORT（include/uapi/linux/in.h），Python 3.13 之前的 socket 模块未导出
+IP_BIND_ADDRESS_NO_PORT = getattr(socket, 'IP_BIND_ADDRESS_NO_PORT',
+                                  24 if sys.platform.startswith('linux') else None)
+
+
+@dataclass(frozen=True)
+class SocketProfile:
+    """一组套接字选项；服务器用 apply_listener，客户端用 apply_connection"""
+    name: str
+    nodelay: bool = False
+    keepalive: bool = False
+    buffer_size: int = 0  # SO_RCVBUF/SO_SNDBUF，0 表示使用内核默认值并保留自动调整
+    defer_accept: int = 0  # 监听套接字的 TCP_DEFER_ACCEPT 秒数，0 表示不设置
+    bind_no_port: bool = False  # 绑定源地址时推迟到 connect 才分配端口
+
+    def _options(self, listener: bool, bound: bool = True) -> List[Tuple[str, int, Optional[int], int]]:
+        """返回 (选项名, level, optname, 值) 列表，当前平台不支持的选项 optname 为 None"""
+        options = []
+        if self.nodelay:
+            options.append(('TCP_NODELAY', socket.IPPROTO_TCP, 1))
+        if self.keepalive:
+            options += [('SO_KEEPALIVE', socket.SOL_SOCKET, 1),
+                        ('TCP_KEEPIDLE', socket.IPPROTO_TCP, KEEPALIVE_IDLE),
+                        ('TCP_KEEPINTVL', socket.IPPROTO_TCP, KEEPALIVE_INTERVAL),
+                        ('TCP_KEEPCNT', socket.IPPROTO_TCP, KEEPALIVE_COUNT)]
+        if self.buffer_size:
+            options += [('SO_RCVBUF', socket.SOL_SOCKET, self.buffer_size),
+                        ('SO_SNDBUF', socket.SOL_SOCKET, self.buffer_size)]
+        if listener and self.defer_accept:
+            options.append(('TCP_DEFER_ACCEPT', socket.IPPROTO_TCP, self.defer_accept))
+        if not listener and bound and self.bind_no_port:
+            options.append(('IP_BIND_ADDRESS_NO_PORT', socket.IPPROTO_IP, 1))
+        return [(name, level, _OPTNAMES.get(name, getattr(socket, name, None)), value)
+                for name, level, value in options]
+
+    @property
+    def enabled(self) -> bool:
+        """客户端连接是否需要在 connect 之前设置选项"""
+        return bool(self.nodelay or self.keepalive or self.buffer_size or self.bind_no_port)
+
+    def unsupported(self) -> List[str]:
+        """当前平台不支持、会被跳过的选项"""
+        options = self._options(listener=True) + self._options(listener=False)
+        return sorted({name for name, _, optname, _ in options if optname is None})
+
+    @staticmethod
+    def _apply(sock: socket.socket, options) -> None:
+        for _, level, optname, value in options:
+            if optname is not None:
+                sock.setsockopt(level, optname, value)
+
+    def apply_listener(self, sock: socket.socket) -> None:
+        """设置监听套接字，之后 accept 的连接继承这些选项"""
+        self._apply(sock, self._options(listener=True))
+
+    def apply_connection(self, sock: socket.socket, bound: bool = False) -> None:
+        """在 bind/connect 之前设置客户端套接字；bound 表示随后要绑定源地址"""
+        self._apply(sock, self._options(listener=False, bound=bound))
+
+    def describe(self, listener: bool) -> str:
+        """配置名及启用的选项，如 lean（TCP_NODELAY, keepalive 60s/10s×5, SO_RCVBUF=4096, ...）"""
+        options = []
+        for name, _, _, value in self._options(listener):
+            if name == 'TCP_KEEPIDLE':
+                options.append(f"keepalive {KEEPALIVE_IDLE}s/{KEEPALIVE_INTERVAL}s×{KEEPALIVE_COUNT}")
+            elif name in ('TCP_NODELAY', 'IP_BIND_ADDRESS_NO_PORT'):
+                options.append(name)
+            elif name not in ('SO_KEEPALIVE', 'TCP_KEEPINTVL', 'TCP_KEEPCNT'):
+                options.append(f"{name}={value}")
+        return f"{self.name}（{', '.join(options) if options else '内核默认'}）"
+
+
+_OPTNAMES = {'IP_BIND_ADDRESS_NO_PORT': IP_BIND_ADDRESS_NO_PORT}
+
+SOCKET_PROFILES: Dict[str, SocketProfile] = {
+    'default': SocketProfile('default'),
+    'nodelay': SocketProfile('nodelay', nodelay=True),
+    'keepalive': SocketProfile('keepalive', nodelay=True, keepalive=True),
+    'lean': SocketProfile('lean', nodelay=True, keepalive=True, buffer_size=LEAN_BUFFER_SIZE,
+                          defer_accept=DEFER_ACCEPT_TIMEOUT, bind_no_port=True),
+}
+SOCKET_PROFILE_HELP = ('套接字配置：default 内核默认；nodelay 设置 TCP_NODELAY；keepalive 另外启用'
+                       '内核 TCP keepalive 代替应用层心跳；lean 另外把收发缓冲区设为 '
+                       f'{LEAN_BUFFER_SIZE} 字节，服务器设置 TCP_DEFER_ACCEPT，'
+                       '客户端绑定源地址时设置 IP_BIND_ADDRESS_NO_PORT')
+
+
+def get_profile(name: str, listener: bool) -> SocketProfile:
+    """按名称取得配置，输出启用的选项及当前平台不支持而跳过的选项"""
+    profile = SOCKET_PROFILES[name]
+    logging.info(f"套接字配置: {profile.describe(listener)}")
+    skipped = profile.unsupported()
+    if skipped:
+        logging.warning(f"当前平台不支持 {', '.join(skipped)}，已跳过")
+    return profile
@@ -0,0 +1,117 @@
+"""多源地址绑定：把连接分散到多个本地地址上，突破单个源地址的临时端口数限制
+
+一个源地址到同一服务器 ip:port 最多只能建立约 本地端口范围 个连接
+（/proc/sys/net/ipv4/ip_local_port_range，默认约 28k）。每个源地址单独记录活动
+连接数，达到端口容量或出现 EADDRNOTAVAIL/EADDRINUSE 时暂时跳过该地址。
+"""
+
+import errno
+import ipaddress
+from typing import Dict, List, Optional
+
+DEFAULT_PORT_CAPACITY = 28232  # Linux 默认 32768-60999
+EXHAUSTED_COOLDOWN = 1.0  # 源地址端口耗尽后暂停使用的时间（秒）
+PORT_EXHAUSTION_ERRNOS = frozenset((errno.EADDRNOTAVAIL, errno.EADDRINUSE))
+MAX_SOURCE_ADDRESSES = 65536
+
+
+def parse_source_ips(spec: str) -> List[str]:
+    """解析源地址列表：逗号分隔，每项可以是单个地址、CIDR 或 起始-结束 范围"""
+    addresses: List[str] = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if '-' in item:
+            first, last = (ipaddress.ip_address(part.strip()) for part in item.split('-', 1))
+            if first.version != last.version or int(last) < int(first):
+                raise ValueError(f"无效的地址范围: {item}")
+            count = int(last) - int(first) + 1
+            if len(addresses) + count > MAX_SOURCE_ADDRESSES:
+                raise ValueError(f"源地址过多: {item}")
+            addresses.extend(str(first + i) for i in range(count))
+        elif '/' in item:
+            network = ipaddress.ip_network(item, strict=False)
+            hosts = list(network.hosts()) if network.num_addresses > 2 else list(network)
+            if len(addresses) + len(hosts) > MAX_SOURCE_ADDRESSES:
+                raise ValueError(f"源地址过多: {item}")
+            addresses.extend(str(host) for host in hosts)
+        else:
+            addresses.append(str(ipaddress.ip_address(item)))
+    if not addresses:
+        raise ValueError(f"未指定源地址: {spec}")
+    return addresses
+
+
+def local_port_capacity() -> int:
+    """每个源地址可用的临时端口数"""
+    try:
+        with open('/proc/sys/net/ipv4/ip_local_port_range', 'r') as f:
+            low, high = (int(value) for value in f.read().split())
+        return high - low + 1
+    except (OSError, ValueError):
+        return DEFAULT_PORT_CAPACITY
+
+
+class SourceAddressPool:
+    """源地址池：轮询选择仍有端口余量的地址，并维护每个地址的活动连接数和失败数
+
+    active/failures 直接引用统计对象中的字典，以便汇总和报告。
+    """
+
+    def __init__(self, addresses: List[str], active: Dict[str, int], failures: Dict[str, int],
+                 capacity: Optional[int] = None):
+        self.addresses = addresses
+        self.capacity = capacity or local_port_capacity()
+        self.active = active
+        self.failures = failures
+        for address in addresses:
+            active.setdefault(address, 0)
+        self._exhausted_until = [0.0] * len(addresses)
+        self._cursor = 0
+
+    def pick(self, now: float) -> Optional[int]:
+        """选择下一个可用的源地址序号，全部不可用时返回 None"""
+        count = len(self.addresses)
+        for _ in range(count):
+            index = self._cursor
+            self._cursor = (index + 1) % count
+            if self._exhausted_until[index] > now:
+                continue
+            if self.active[self.addresses[index]] >= self.capacity:
+                continue
+            return index
+        return None
+
+    def local_addr(self, index: int) -> tuple:
+        return (self.addresses[index], 0)
+
+    def connected(self, index: int) -> None:
+        self.active[self.addresses[index]] += 1
+
+    def disconnected(self, index: int) -> None:
+        self.active[self.addresses[index]] -= 1
+
+    def failed(self, index: int, errno_value: Optional[int], now: float) -> bool:
+        """记录失败；端口耗尽时暂停该地址，仍有其他地址可用时返回 True（无需全局退避）"""
+        address = self.addresses[index]
+        self.failures[address] = self.failures.get(address, 0) + 1
+        if errno_value not in PORT_EXHAUSTION_ERRNOS:
+            return False
+        self._exhausted_until[index] = now + EXHAUSTED_COOLDOWN
+        return any(until <= now for until in self._exhausted_until)
+
+
+def format_sources(active: Dict[str, int], failures: Dict[str, int], limit: int = 8) -> str:
+    """格式化每个源地址的连接数，地址较多时只显示汇总"""
+    if not active:
+        return ""
+    if len(active) <= limit:
+        parts = []
+        for address, count in active.items():
+            failed = failures.get(address, 0)
+            parts.append(f"{address}={count}" + (f"(失败{failed})" if failed else ""))
+        return ', '.join(parts)
+    counts = list(active.values())
+    return (f"{len(counts)} 个地址, 每地址连接 最少 {min(counts)} / 最多 {max(counts)} / "
+            f"平均 {sum(counts) / len(counts):.0f}, 失败 {sum(failures.values())}")
@@ -0,0 +1,254 @@
+"""统计信息：无锁计数器的快照与跨进程汇总
+
+统计对象是普通的 dataclass，字段只在事件循环线程中同步更新（更新过程中没有
+await），因此不需要 asyncio.Lock。多进程模式下每个进程各持一份，父进程通过
+merge_snapshots 汇总。字段类型约定：
+
+- int/float：计数器或瞬时值，汇总时相加
+- dict（如按状态、按错误码的细分）：汇总时按键相加
+- 带 copy()/merge() 方法的对象（如直方图）：快照时复制，汇总时合并
+"""
+
+import os
+import sys
+from dataclasses import fields
+from typing import Dict, Iterable, List, Sequence
+
+
+def take_snapshot(stats) -> Dict:
+    """复制统计对象的当前值，供报告或发送给父进程使用"""
+    snapshot = {}
+    for f in fields(stats):
+        value = getattr(stats, f.name)
+        if isinstance(value, dict):
+            value = dict(value)
+        elif hasattr(value, 'copy'):
+            value = value.copy()
+        snapshot[f.name] = value
+    return snapshot
+
+
+def _merge_value(current, value):
+    """合并同一字段的两个值"""
+    if current is None:
+        if isinstance(value, dict):
+            return _merge_value({}, value)
+        return value.copy() if hasattr(value, 'merge') else value
+    if isinstance(value, dict):
+        for key, item in value.items():
+            current[key] = _merge_value(current.get(key), item)
+        return current
+    if hasattr(current, 'merge'):
+        current.merge(value)
+        return current
+    return current + value
+
+
+def merge_snapshots(snapshots: Iterable[Dict]) -> Dict:
+    """逐项汇总多个统计快照"""
+    merged: Dict = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.items():
+            merged[key] = _merge_value(merged.get(key), value)
+    return merged
+
+
+HISTOGRAM_TAG = '__histogram__'  # encode_snapshot 中标记直方图的键
+
+
+def encode_snapshot(snapshot: Dict) -> Dict:
+    """把快照转换为可 JSON 序列化的字典（直方图以稀疏计数表示），用于跨主机发送"""
+    encoded = {}
+    for key, value in snapshot.items():
+        if isinstance(value, LatencyHistogram):
+            value = {HISTOGRAM_TAG: value.to_dict()}
+        encoded[key] = value
+    return encoded
+
+
+def decode_snapshot(encoded: Dict) -> Dict:
+    """encode_snapshot 的逆操作"""
+    snapshot = {}
+    for key, value in encoded.items():
+        if isinstance(value, dict) and HISTOGRAM_TAG in value:
+            value = LatencyHistogram.from_dict(value[HISTOGRAM_TAG])
+        snapshot[key] = value
+    return snapshot
+
+
+def get_rss_bytes() -> int:
+    """返回当前进程的常驻内存（字节），无法获取时返回 0"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # 非 Linux 的 Unix 系统只能取峰值；macOS 单位为字节，其他为 KB
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return 0
+
+
+def format_rss(rss_bytes: int, baseline_bytes: int, connections: int) -> str:
+    """格式化进程内存及扣除启动基线后的每连接平均内存"""
+    if not rss_bytes:
+        return "未知"
+    text = f"{rss_bytes / 1048576:.1f}MB"
+    if connections > 0:
+        text += f" (每连接 {(rss_bytes - baseline_bytes) / connections / 1024:.2f}KB)"
+    return text
+
+
+class LatencyHistogram:
+    """固定内存的对数-线性延迟直方图（HDR 风格），单位为微秒
+
+    小于 2**SUB_BITS 微秒的值逐一计数，更大的值每个二进制数量级分成
+    2**(SUB_BITS-1) 个桶，相对误差不超过 1/2**(SUB_BITS-1)（约 1.6%）。
+    record 只做几次整数运算和一次列表自增，可以在每个连接上调用。
+    """
+
+    SUB_BITS = 7
+    SUB_COUNT = 1 << SUB_BITS
+    HALF_COUNT = SUB_COUNT >> 1
+    MAX_VALUE = (1 << 40) - 1  # 约 12.7 天
+    BUCKETS = SUB_COUNT + (40 - SUB_BITS) * HALF_COUNT
+
+    __slots__ = ('counts', 'count', 'total', 'max_value')
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0  # 所有记录值之和（微秒），用于导出 Prometheus 的 _sum
+        self.max_value = 0
+
+    def _index(self, value: int) -> int:
+        if value < self.SUB_COUNT:
+            return value
+        shift = value.bit_length() - self.SUB_BITS
+        return self.SUB_COUNT + (shift - 1) * self.HALF_COUNT + (value >> shift) - self.HALF_COUNT
+
+    def _upper_bound(self, index: int) -> int:
+        """桶内可能的最大值"""
+        if index < self.SUB_COUNT:
+            return index
+        shift, offset = divmod(index - self.SUB_COUNT, self.HALF_COUNT)
+        shift += 1
+        return ((offset + self.HALF_COUNT + 1) << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        """记录一次耗时（秒）"""
+        value = int(seconds * 1000000)
+        if value > self.MAX_VALUE:
+            value = self.MAX_VALUE
+        elif value < 0:
+            value = 0
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max_value:
+            self.max_value = value
+
+    def copy(self) -> 'LatencyHistogram':
+        other = LatencyHistogram.__new__(LatencyHistogram)
+        other.counts = self.counts[:]
+        other.count = self.count
+        other.total = self.total
+        other.max_value = self.max_value
+        return other
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        """把另一个直方图的计数合并进来"""
+        counts = self.counts
+        for index, n in enumerate(other.counts):
+            if n:
+                counts[index] += n
+        self.count += other.count
+        self.total += other.total
+        self.max_value = max(self.max_value, other.max_value)
+
+    def to_dict(self) -> Dict:
+        """导出为只含非空桶的字典，用于 JSON 序列化"""
+        return {
+            'buckets': [[index, n] for index, n in enumerate(self.counts) if n],
+            'count': self.count,
+            'total': self.total,
+            'max_value': self.max_value,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'LatencyHistogram':
+        histogram = cls()
+        for index, n in data['buckets']:
+            histogram.counts[index] = n
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.max_value = data['max_value']
+        return histogram
+
+    def subtract(self, earlier: 'LatencyHistogram') -> 'LatencyHistogram':
+        """返回相对较早快照的增量，用于计算单个报告周期内的分位数
+
+        增量的最大值无法精确还原，取最高非空桶的上界。
+        """
+        delta = LatencyHistogram()
+        delta.counts = [a - b for a, b in zip(self.counts, earlier.counts)]
+        delta.count = self.count - earlier.count
+        delta.total = self.total - earlier.total
+        for index in range(self.BUCKETS - 1, -1, -1):
+            if delta.counts[index]:
+                delta.max_value = min(self._upper_bound(index), self.max_value)
+                break
+        return delta
+
+    def cumulative_counts(self, bounds: Sequence[float]) -> List[int]:
+        """返回每个上界（秒，升序）以内的累计计数，用于导出 Prometheus 直方图
+
+        只统计上界不超过边界的桶，桶跨越边界时计入下一个边界。
+        """
+        counts = self.counts
+        result = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            limit = bound * 1000000
+            while index < self.BUCKETS and self._upper_bound(index) <= limit:
+                seen += counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+    def percentile(self, percent: float) -> float:
+        """返回分位数（秒），直方图为空时返回 0"""
+        if not self.count:
+            return 0.0
+        target = max(1, int(self.count * percent / 100.0 + 0.5))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(self._upper_bound(index), self.max_value) / 1000000
+        return self.max_value / 1000000
+
+
+def format_throughput(bytes_sent: float, bytes_received: float, messages: float,
+                      elapsed: float, unit: str = '消息') -> str:
+    """把一段时间内的字节数和消息数格式化为 MB/s 与 消息/s；服务端按读取次数计数，unit 为“读取”"""
+    elapsed = max(elapsed, 1e-9)
+    return (f"发送 {bytes_sent / elapsed / 1048576:.2f}MB/s, "
+            f"接收 {bytes_received / elapsed / 1048576:.2f}MB/s, "
+            f"{unit} {messages / elapsed:.1f}/s")
+
+
+REPORT_PERCENTILES = (50, 90, 99, 99.9)
+
+
+def format_latency(histogram: LatencyHistogram) -> str:
+    """格式化为 'p50=...ms p90=... max=... (n=...)'"""
+    if not histogram.count:
+        return "无数据"
+    parts = [f"p{p:g}={histogram.percentile(p) * 1000:.3f}ms" for p in REPORT_PERCENTILES]
+    parts.append(f"max={histogram.max_value / 1000:.3f}ms")
+    return ' '.join(parts) + f" (n={histogram.count})"
@@ -0,0 +1,92 @@
+"""哈希时间轮：用一个事件循环定时器批量管理大量连接的到期时间
+
+每个到期时间按 tick 粒度落入一个槽位，时间轮每个 tick 唤醒一次，把当前槽位中
+到期的键一次性交给回调处理。与每个连接各自调用 call_later / wait_for /
+asyncio.sleep 相比，事件循环的定时器堆中只有一个条目，也不需要为每次等待创建任务。
+"""
+
+import asyncio
+import logging
+import math
+from typing import Any, Callable, Dict, List
+
+
+class TimerWheel:
+    """时间轮；callback(key) 在 key 到期时被调用，需要周期执行时在回调中重新 schedule"""
+
+    def __init__(self, callback: Callable[[Any], None], tick: float = 1.0, slots: int = 512):
+        self.callback = callback
+        self.tick = tick
+        self._slots: List[Dict[Any, int]] = [{} for _ in range(slots)]
+        self._count = 0
+        self._loop = None
+        self._origin = 0.0
+        self._current = 0  # 已处理到的 tick
+        self._handle = None
+
+    def _now_tick(self) -> int:
+        return int((self._loop.time() - self._origin) / self.tick)
+
+    def start(self) -> None:
+        """在当前事件循环上启动时间轮，首次 schedule 时会自动调用"""
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._origin = self._loop.time()
+        self._current = 0
+        self._handle = self._loop.call_at(self._origin + self.tick, self._advance)
+
+    def stop(self) -> None:
+        """停止时间轮并丢弃所有未到期的键"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._loop = None
+        for slot in self._slots:
+            slot.clear()
+        self._count = 0
+
+    def schedule(self, key: Any, delay: float) -> int:
+        """在 delay 秒后（向上取整到 tick）触发 key，返回用于 cancel 的目标 tick"""
+        if self._loop is None:
+            self.start()
+        target = self._now_tick() + max(1, math.ceil(delay / self.tick))
+        if target <= self._current:
+            target = self._current + 1
+        slot = self._slots[target % len(self._slots)]
+        if key not in slot:
+            self._count += 1
+        slot[key] = target
+        return target
+
+    def cancel(self, key: Any, target: int) -> None:
+        """取消 schedule 返回 target 的键；键已触发或已取消时不做任何事"""
+        slot = self._slots[target % len(self._slots)]
+        if slot.get(key) == target:
+            del slot[key]
+            self._count -= 1
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _advance(self) -> None:
+        now = self._now_tick()
+        slots = self._slots
+        while self._current < now:
+            self._current += 1
+            slot = slots[self._current % len(slots)]
+            if not slot:
+                continue
+            # 槽位中还可能有多转一圈以后才到期的键
+            due = [key for key, target in slot.items() if target <= self._current]
+            for key in due:
+                del slot[key]
+            self._count -= len(due)
+            for key in due:
+                try:
+                    self.callback(key)
+                except Exception as e:
+                    logging.error(f"处理定时事件时出错: {e}")
+        if self._loop is not None:
+            self._handle = self._loop.call_at(
+                self._origin + (self._current + 1) * self.tick, self._advance)
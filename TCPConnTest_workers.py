@@ -0,0 +1,120 @@
+"""多进程工作池：每个工作进程运行独立的事件循环，父进程汇总统计信息"""
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from TCPConnTest_stats import merge_snapshots
+
+STOP_POLL_INTERVAL = 0.2  # 检查 stop 事件的间隔（秒）
+
+
+def split_evenly(total: int, parts: int) -> List[int]:
+    """将 total 尽量均匀地分成 parts 份"""
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+async def publish_stats(stats_queue, worker_id: int, get_stats: Callable[[], Dict],
+                        interval: float) -> None:
+    """工作进程内定期将统计快照发送给父进程"""
+    while True:
+        try:
+            stats_queue.put_nowait((worker_id, get_stats()))
+        except Exception as e:
+            logging.error(f"发送统计快照失败: {e}")
+        await asyncio.sleep(interval)
+
+
+def run_workers(target: Callable, worker_args: Sequence[tuple],
+                report: Callable[[Dict, int], None], report_interval: float,
+                on_start: Optional[Callable[[Callable[[], Dict]], None]] = None,
+                stop_timeout: float = 5.0, stop: Optional[threading.Event] = None) -> None:
+    """启动工作进程并按固定间隔输出汇总报告，直到所有工作进程退出
+
+    target 以 (worker_id, stats_queue, *args) 调用，需为模块级函数以便在
+    spawn 模式（Windows）下序列化。on_start 在工作进程启动后被调用一次，参数为
+    随时返回最新汇总快照的函数（可以在其他线程中调用，如指标端点）。
+    退出时给工作进程 stop_timeout 秒关闭各自的连接。stop 被置位时提前结束，
+    与 Ctrl+C 一样通知工作进程关闭连接。工作进程关闭连接后发送最终快照，
+    全部退出后据此输出最后一次汇总报告。
+    """
+    stats_queue = multiprocessing.Queue()
+    processes = []
+    for worker_id, args in enumerate(worker_args):
+        process = multiprocessing.Process(
+            target=target,
+            args=(worker_id, stats_queue) + tuple(args),
+            name=f"worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        processes.append(process)
+    logging.info(f"已启动 {len(processes)} 个工作进程")
+
+    latest: Dict[int, Dict] = {}
+    if on_start is not None:
+        on_start(lambda: merge_snapshots(list(latest.values())))
+    next_report = time.monotonic() + report_interval
+    unreported = False  # 上次报告之后是否收到了新快照
+    stopped = False
+    try:
+        while any(p.is_alive() for p in processes):
+            if stop is not None and stop.is_set():
+                break
+            wait = max(0.0, next_report - time.monotonic())
+            if stop is not None:
+                wait = min(wait, STOP_POLL_INTERVAL)
+            try:
+                worker_id, snapshot = stats_queue.get(timeout=wait)
+                latest[worker_id] = snapshot
+                unreported = True
+            except queue.Empty:
+                pass
+            if time.monotonic() >= next_report:
+                alive = sum(1 for p in processes if p.is_alive())
+                try:
+                    report(merge_snapshots(list(latest.values())), alive)
+                except Exception as e:
+                    logging.error(f"生成汇总报告时出错: {e}")
+                unreported = False
+                next_report += report_interval
+        stopped = stop is not None and stop.is_set()
+    except KeyboardInterrupt:
+        stopped = True  # 工作进程同样收到 SIGINT，各自关闭连接；汇总后再继续抛出
+        raise
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        stop_deadline = time.monotonic() + stop_timeout
+        # 等待期间继续接收快照：队列的管道写满时，工作进程要等数据被读走才能退出
+        while any(p.is_alive() for p in processes) and time.monotonic() < stop_deadline:
+            try:
+                worker_id, snapshot = stats_queue.get(timeout=STOP_POLL_INTERVAL)
+                latest[worker_id] = snapshot
+                unreported = True
+            except queue.Empty:
+                pass
+        for process in processes:
+            process.join(timeout=max(0.0, stop_deadline - time.monotonic()))
+        # 工作进程在关闭连接之后、退出之前发送最终快照，全部退出后再汇总，活动连接数才是关闭后的
+        while True:
+            try:
+                worker_id, snapshot = stats_queue.get_nowait()
+            except queue.Empty:
+                break
+            latest[worker_id] = snapshot
+            unreported = True
+        if unreported or stopped:
+            try:
+                report(merge_snapshots(list(latest.values())), 0)
+            except Exception as e:
+                logging.error(f"生成汇总报告时出错: {e}")
+        for process in processes:
+            if process.exitcode:
+                logging.warning(f"工作进程 {process.name} 异常退出，退出码 {process.exitcode}")